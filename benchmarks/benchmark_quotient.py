@@ -28,9 +28,9 @@ for r in n_rows:
     partition = [where(id_map == i)[0].tolist() for i in ids]
     # Networkx implementation
     start_time = timeit.default_timer()
-    nx_G = nx.from_scipy_sparse_matrix(m)
+    nx_G = nx.from_scipy_sparse_array(m)
     nx_Gq = nx.quotient_graph(G=nx_G, partition=partition)
-    nx_q = nx.to_scipy_sparse_matrix(nx_Gq)
+    nx_q = nx.to_scipy_sparse_array(nx_Gq)
     nx_q.eliminate_zeros()
     nx_time.append(timeit.default_timer() - start_time)
     # PSS implementation
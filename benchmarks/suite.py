@@ -0,0 +1,404 @@
+'''Reproducible benchmark suite for pysimscale
+
+Times every public function (and the `SymmetricSparse` operations) over a grid of sizes, densities, dtypes, metrics, block sizes and worker counts, records wall time and
+peak memory as JSON, and optionally compares the run against a saved baseline.
+
+Usage (from the repository root, with the package installed or on `PYTHONPATH`):
+    python benchmarks/suite.py -o bench.json                          # full run
+    python benchmarks/suite.py --quick -o baseline.json               # small sizes, for CI
+    python benchmarks/suite.py --quick --compare baseline.json        # exit code 1 on regressions
+    python benchmarks/suite.py --filter 'quotient|shuffle' --list     # show the selected cases
+
+Notes:
+- Time is the minimum over `--repeat` runs (after one warm-up run), which is the most stable statistic for regression checks.
+- Peak memory is measured in a separate run with `tracemalloc` (Numpy reports its allocations to it). Memory allocated inside `joblib`
+  workers is not included, so parallel cases mostly report the memory of the parent process.
+'''
+import atexit
+import gc
+import json
+import platform
+import re
+import shutil
+import sys
+import tempfile
+import tracemalloc
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+from importlib.util import find_spec
+from itertools import product
+from os import path
+from timeit import default_timer
+
+import numpy
+import scipy
+from numpy import save, arange
+from numpy.random import default_rng
+from scipy.sparse import random as sparse_random, csr_matrix, coo_matrix, triu
+
+import pysimscale
+from pysimscale import (
+    truncated_sparse_similarity, similarity_sparse_block, truncated_connected_components, block_size_for_memory,
+    quotient_similarity, merge_row_partition, sim_matrix_shuffle, row_shuffle_matrix, id_block_matrix, is_partition,
+    is_permutation, sort_partition, labels2partition, series2array2D, similarity_shard, merge_shards, shard_range, load_features,
+    SymmetricSparse, check_dtype, metric_preprocess, iter_similarity_blocks, find_roots, union_edges
+)
+
+HAS_PANDAS = find_spec('pandas') is not None
+
+SIZES = {'quick': [200, 1000], 'full': [1000, 5000, 20000]}
+N_FEATURES = 16
+
+
+def features(n, dtype, seed=0):
+    '''Random features: binary for integer / boolean types, normal otherwise'''
+    rng = default_rng(seed)
+    if dtype in ('bool', 'int32', 'int64'):
+        return rng.integers(0, 2, (n, N_FEATURES)).astype(dtype)
+    return rng.normal(0, 1, (n, N_FEATURES)).astype(dtype)
+
+
+def similarity_matrix(n, density, seed=0):
+    '''Random symmetric sparse similarity matrix with values in (0, 1]'''
+    m = triu(sparse_random(n, n, density=density / 2, format='csr', random_state=seed), k=1)
+    m = m + m.T
+    m.setdiag(1)
+    return csr_matrix(m)
+
+
+def partition(n, n_parts, seed=0):
+    return labels2partition(default_rng(seed).integers(0, n_parts, n))[0]
+
+
+def setup_similarity(n, dtype, metric, block_size, n_jobs):
+    a = features(n, dtype)
+    return lambda: truncated_sparse_similarity(a, metric=metric, block_size=block_size, thresh=0.5, n_jobs=n_jobs)
+
+
+def setup_symmetric_similarity(n, dtype, metric, block_size):
+    a = features(n, dtype)
+    return lambda: truncated_sparse_similarity(a, metric=metric, block_size=block_size, thresh=0.5, n_jobs=1, symmetric=True)
+
+
+def setup_symmetric(n, density, op):
+    m = similarity_matrix(n, density)
+    s = SymmetricSparse.from_matrix(m)
+    x = default_rng(0).normal(0, 1, n)
+    p = partition(n, int(n ** 0.5))
+    order = default_rng(0).permutation(n).tolist()
+    ops = {
+        'from_matrix': lambda: SymmetricSparse.from_matrix(m),
+        'dot': lambda: s.dot(x),
+        'neighbours': lambda: [s.neighbours(i) for i in range(0, n, 10)],
+        'tocsr': lambda: s.tocsr(),
+        'quotient_sum': lambda: quotient_similarity(s, p, agg='sum', n_cpu=1),
+        'permute': lambda: s.permute(order),
+        'sim_matrix_shuffle': lambda: sim_matrix_shuffle(s, order)
+    }
+    return ops[op]
+
+
+def setup_check_dtype(n, dtype):
+    a = features(n, dtype)
+    return lambda: check_dtype(a)
+
+
+def setup_metric_preprocess(n, dtype, metric):
+    a = features(n, dtype)
+    return lambda: metric_preprocess(a, metric)
+
+
+def setup_iter_similarity_blocks(n, dtype, metric, block_size, n_jobs):
+    '''Consume the blocks one at a time, without stacking them'''
+    a = features(n, dtype)
+    blocks = [list(range(i, min(i + block_size, n))) for i in range(0, n, block_size)]
+    return lambda: sum(m.nnz for m in iter_similarity_blocks(a, blocks, n_jobs=n_jobs, metric=metric, thresh=0.5))
+
+
+def setup_union_find(n, density, op):
+    edges = coo_matrix(triu(similarity_matrix(n, density), k=1))
+    # Random recursive forest (the parent of `i` is drawn from 0..i), so the roots are O(log n) steps away
+    forest = (default_rng(0).random(n) * arange(1, n + 1)).astype('int64')
+    ops = {
+        'union_edges': lambda: union_edges(arange(n), edges.row, edges.col),
+        'find_roots': lambda: find_roots(forest, arange(n))
+    }
+    return ops[op]
+
+
+def setup_block(n, dtype, metric, block_size):
+    a = features(n, dtype)
+    return lambda: similarity_sparse_block(a, list(range(block_size)), thresh=0.5, metric=metric)
+
+
+def setup_components(n, dtype, metric, block_size, n_jobs):
+    a = features(n, dtype)
+    return lambda: truncated_connected_components(a, metric=metric, block_size=block_size, thresh=0.8, n_jobs=n_jobs)
+
+
+def setup_shards(n, n_shards, block_size):
+    '''Write the features to disk once, then time computing all the shards from the memory-mapped file and merging them'''
+    tmp = tempfile.mkdtemp(prefix='pysimscale-bench-')
+    atexit.register(shutil.rmtree, tmp, ignore_errors=True)
+    features_path = path.join(tmp, 'features.npy')
+    save(features_path, features(n, 'float64'))
+    shards = [path.join(tmp, 'shard_{}.npz'.format(i)) for i in range(n_shards)]
+
+    def run():
+        a = load_features(features_path)
+        for i, s in enumerate(shards):
+            similarity_shard(a, s, i, n_shards, block_size=block_size, metric='cosine', thresh=0.5, n_jobs=1)
+        return merge_shards(shards)
+
+    return run
+
+
+def setup_quotient(n, density, n_parts, agg, n_cpu):
+    m, p = similarity_matrix(n, density), partition(n, n_parts)
+    return lambda: quotient_similarity(m, p, agg=agg, n_cpu=n_cpu)
+
+
+def setup_merge_rows(n, density, n_parts, n_cpu):
+    m, p = similarity_matrix(n, density), partition(n, n_parts)
+    agg = lambda m, p: csr_matrix(m[p, :].sum(axis=0))
+    return lambda: merge_row_partition(m, p, agg, n_cpu)
+
+
+def setup_shuffle(n, density):
+    m, order = similarity_matrix(n, density), default_rng(0).permutation(n).tolist()
+    return lambda: sim_matrix_shuffle(m, order)
+
+
+def setup_row_shuffle_matrix(n):
+    order = default_rng(0).permutation(n).tolist()
+    return lambda: row_shuffle_matrix(order)
+
+
+def setup_id_block_matrix(n, n_ids):
+    ids = sorted(default_rng(0).integers(0, n_ids, n).tolist())
+    return lambda: id_block_matrix(ids, diag_value=0)
+
+
+def setup_is_partition(n, n_parts):
+    p = partition(n, n_parts)
+    return lambda: is_partition(p, start=0, end=n - 1)
+
+
+def setup_is_permutation(n):
+    order = default_rng(0).permutation(n).tolist()
+    return lambda: is_permutation(order)
+
+
+def setup_sort_partition(n, n_parts):
+    p = partition(n, n_parts)
+    return lambda: sort_partition(p)
+
+
+def setup_labels2partition(n, n_labels):
+    labels = default_rng(0).integers(0, n_labels, n)
+    return lambda: labels2partition(labels)
+
+
+def setup_series2array2D(n):
+    from pandas import Series
+
+    rows = features(n, 'float64').tolist()
+    rows[::10] = [None] * len(rows[::10])
+    s = Series(rows)
+    return lambda: series2array2D(s)
+
+
+def setup_shard_range(n, n_shards, block_size):
+    return lambda: [shard_range(n, i, n_shards, block_size) for i in range(n_shards)]
+
+
+def setup_block_size_for_memory(n, memory):
+    return lambda: block_size_for_memory(n, memory, n_jobs=1)
+
+
+def cases(profile):
+    '''Yield `(name, params, setup)`: `setup(**params)` prepares the data and returns the function to time (called without arguments)'''
+    sizes = SIZES[profile]
+    workers = (1, 2)
+    dtypes = {'cosine': ('float32', 'float64', 'int64'), 'hamming': ('bool', 'int64'), 'jaccard': ('bool', 'int64'), 'rbf': ('float64',)}
+
+    for n, metric, block_size, n_jobs in product(sizes, ('cosine', 'hamming'), (1, 100, 1000), workers):
+        if block_size == 1 and n > 1000:
+            continue
+        for dtype in dtypes[metric]:
+            yield 'truncated_sparse_similarity', dict(n=n, dtype=dtype, metric=metric, block_size=block_size, n_jobs=n_jobs), setup_similarity
+
+    for n, metric in product(sizes, ('jaccard', 'rbf')):
+        for dtype in dtypes[metric]:
+            yield 'truncated_sparse_similarity', dict(n=n, dtype=dtype, metric=metric, block_size=100, n_jobs=1), setup_similarity
+
+    for n in sizes:
+        yield 'truncated_sparse_similarity(symmetric)', dict(n=n, dtype='float64', metric='cosine', block_size=100), setup_symmetric_similarity
+
+    for n, density, op in product(sizes, (0.001, 0.01), ('from_matrix', 'dot', 'neighbours', 'tocsr', 'quotient_sum', 'permute', 'sim_matrix_shuffle')):
+        yield 'SymmetricSparse', dict(n=n, density=density, op=op), setup_symmetric
+
+    for n, metric in product(sizes, ('cosine', 'hamming', 'jaccard', 'rbf')):
+        for dtype in dtypes[metric]:
+            yield 'similarity_sparse_block', dict(n=n, dtype=dtype, metric=metric, block_size=100), setup_block
+
+    for n, dtype in product(sizes, ('float16', 'int64')):
+        yield 'check_dtype', dict(n=n, dtype=dtype), setup_check_dtype
+
+    for n, metric in product(sizes, ('cosine', 'hamming', 'jaccard')):
+        for dtype in dtypes[metric]:
+            yield 'metric_preprocess', dict(n=n, dtype=dtype, metric=metric), setup_metric_preprocess
+
+    for n, n_jobs in product(sizes, workers):
+        yield 'iter_similarity_blocks', dict(n=n, dtype='float64', metric='cosine', block_size=100, n_jobs=n_jobs), setup_iter_similarity_blocks
+
+    for n, density, op in product(sizes, (0.001, 0.01), ('union_edges', 'find_roots')):
+        yield 'union_find', dict(n=n, density=density, op=op), setup_union_find
+
+    for n, block_size, n_jobs in product(sizes, (100, 1000), workers):
+        yield 'truncated_connected_components', dict(n=n, dtype='float64', metric='cosine', block_size=block_size, n_jobs=n_jobs), setup_components
+
+    for n, n_shards in product(sizes, (1, 4)):
+        yield 'similarity_shard+merge_shards', dict(n=n, n_shards=n_shards, block_size=100), setup_shards
+
+    for n, density, agg, n_cpu in product(sizes, (0.001, 0.01), ('sum', 'max'), workers):
+        yield 'quotient_similarity', dict(n=n, density=density, n_parts=int(n ** 0.5), agg=agg, n_cpu=n_cpu), setup_quotient
+
+    for n, density in product(sizes, (0.001, 0.01)):
+        yield 'merge_row_partition', dict(n=n, density=density, n_parts=int(n ** 0.5), n_cpu=1), setup_merge_rows
+        yield 'sim_matrix_shuffle', dict(n=n, density=density), setup_shuffle
+
+    for n in sizes:
+        yield 'row_shuffle_matrix', dict(n=n), setup_row_shuffle_matrix
+        yield 'id_block_matrix', dict(n=n, n_ids=int(n ** 0.5)), setup_id_block_matrix
+        yield 'is_partition', dict(n=n, n_parts=int(n ** 0.5)), setup_is_partition
+        yield 'is_permutation', dict(n=n), setup_is_permutation
+        yield 'sort_partition', dict(n=n, n_parts=int(n ** 0.5)), setup_sort_partition
+        yield 'labels2partition', dict(n=n, n_labels=int(n ** 0.5)), setup_labels2partition
+        yield 'shard_range', dict(n=n, n_shards=8, block_size=100), setup_shard_range
+        yield 'block_size_for_memory', dict(n=n, memory=2 ** 30), setup_block_size_for_memory
+        if HAS_PANDAS:
+            yield 'series2array2D', dict(n=n), setup_series2array2D
+
+
+def measure(f, repeat):
+    '''Minimum wall time over `repeat` runs (after a warm-up run) and peak traced memory of one more run'''
+    f()
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = default_timer()
+        f()
+        times.append(default_timer() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    f()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return min(times), peak
+
+
+def case_key(name, params):
+    return name + json.dumps(params, sort_keys=True)
+
+
+def run(profile, repeat, pattern=None, verbose=True):
+    results = []
+    for name, params, setup in cases(profile):
+        if pattern is not None and not re.search(pattern, name):
+            continue
+        t, peak = measure(setup(**params), repeat)
+        results.append({'name': name, 'params': params, 'time': t, 'peak_memory': peak})
+        if verbose:
+            print('{:<32} {:<90} {:>10.4f}s {:>10.1f}MB'.format(name, json.dumps(params, sort_keys=True), t, peak / 2 ** 20), file=sys.stderr)
+
+    return {
+        'meta': {
+            'date': datetime.now(timezone.utc).isoformat(),
+            'profile': profile,
+            'repeat': repeat,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'numpy': numpy.__version__,
+            'scipy': scipy.__version__,
+            'pysimscale': getattr(pysimscale, '__version__', None)
+        },
+        'results': results
+    }
+
+
+def compare(current, baseline, time_tolerance, memory_tolerance, min_time):
+    '''Compare two runs case by case
+
+    A case regresses when it is slower than the baseline by more than `time_tolerance` (relative, only for cases taking at least
+    `min_time` seconds in the baseline, since shorter ones are dominated by noise) or uses more than `memory_tolerance` more peak memory.
+
+    Returns a list of `(key, metric, baseline value, current value, ratio)` for every regression
+    '''
+    base = {case_key(r['name'], r['params']): r for r in baseline['results']}
+    regressions = []
+
+    for r in current['results']:
+        key = case_key(r['name'], r['params'])
+        if key not in base:
+            continue
+        b = base[key]
+        if b['time'] >= min_time and r['time'] > b['time'] * (1 + time_tolerance):
+            regressions.append((key, 'time', b['time'], r['time'], r['time'] / b['time']))
+        if b['peak_memory'] > 0 and r['peak_memory'] > b['peak_memory'] * (1 + memory_tolerance):
+            regressions.append((key, 'peak_memory', b['peak_memory'], r['peak_memory'], r['peak_memory'] / b['peak_memory']))
+
+    missing = set(base).difference(case_key(r['name'], r['params']) for r in current['results'])
+    if missing:
+        print('{} baseline cases were not run'.format(len(missing)), file=sys.stderr)
+
+    return regressions
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='pysimscale benchmark suite')
+    parser.add_argument('-o', '--output', default=None, help='Save the results as JSON')
+    parser.add_argument('--quick', action='store_true', help='Small sizes only (a few minutes)')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per case. Default is 3')
+    parser.add_argument('--filter', default=None, help='Only run cases whose function name matches this regular expression')
+    parser.add_argument('--list', action='store_true', help='List the selected cases without running them')
+    parser.add_argument('--compare', default=None, help='Baseline JSON to compare against (exit code 1 on regressions)')
+    parser.add_argument('--time-tolerance', type=float, default=0.25, help='Allowed relative slowdown. Default is 0.25')
+    parser.add_argument('--memory-tolerance', type=float, default=0.1, help='Allowed relative peak memory increase. Default is 0.1')
+    parser.add_argument('--min-time', type=float, default=0.005, help='Ignore time changes of cases faster than this in the baseline (seconds). Default is 0.005')
+    args = parser.parse_args(argv)
+
+    profile = 'quick' if args.quick else 'full'
+
+    if args.list:
+        for name, params, _ in cases(profile):
+            if args.filter is None or re.search(args.filter, name):
+                print(name, json.dumps(params, sort_keys=True))
+        return 0
+
+    current = run(profile, args.repeat, args.filter)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['meta']['profile'] != profile:
+            print('Warning: comparing a `{}` run to a `{}` baseline'.format(profile, baseline['meta']['profile']), file=sys.stderr)
+        regressions = compare(current, baseline, args.time_tolerance, args.memory_tolerance, args.min_time)
+        for key, metric, b, c, ratio in regressions:
+            print('REGRESSION {} {}: {:.4g} -> {:.4g} (x{:.2f})'.format(key, metric, b, c, ratio))
+        if regressions:
+            return 1
+        print('No regressions against {}'.format(args.compare))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,36 @@
 # __init__.py
-from .similarity import *
-from .utils import *
-from .shuffle import *
-from .quotient import * 
+# Submodules (and their Scipy / joblib imports) are only loaded when one of their names is first used, so importing the package is cheap
+from importlib import import_module
+
+_EXPORTS = {
+    'similarity': ('BUILTIN_METRICS', 'check_dtype', 'metric_preprocess', 'similarity_sparse_block', 'block_size_for_memory', 'iter_similarity_blocks', 'truncated_sparse_similarity'),
+    'utils': ('is_permutation', 'is_partition', 'sort_partition', 'labels2partition', 'series2array2D', 'load_features', 'id_block_matrix'),
+    'shuffle': ('row_shuffle_matrix', 'sim_matrix_shuffle'),
+    'quotient': ('MATRIX_METHOD_STR', 'merge_row_partition', 'quotient_similarity'),
+    'components': ('find_roots', 'union_edges', 'truncated_connected_components'),
+    'shard': ('shard_range', 'similarity_shard', 'merge_shards'),
+    'symmetric': ('SymmetricSparse',),
+    'stats': ('RunStats',),
+    'parallel': ('DEFAULT_CPUS', 'HAS_JOBLIB')
+}
+_SUBMODULES = ('similarity', 'utils', 'shuffle', 'quotient', 'components', 'shard', 'symmetric', 'stats', 'parallel', 'cli')
+_LOCATIONS = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = [name for names in _EXPORTS.values() for name in names]
+
+
+def __getattr__(name):
+    if name in _LOCATIONS:
+        value = getattr(import_module('.' + _LOCATIONS[name], __name__), name)
+    elif name in _SUBMODULES:
+        value = import_module('.' + name, __name__)
+    else:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+    globals()[name] = value
+
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()).union(__all__, _SUBMODULES))
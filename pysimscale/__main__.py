@@ -0,0 +1,4 @@
+import sys
+from pysimscale.cli import main
+
+sys.exit(main())
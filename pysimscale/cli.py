@@ -0,0 +1,218 @@
+'''Command line entry point for batch similarity and quotient jobs
+
+Examples:
+    pysimscale similarity features.npy -o sim.npz --metric cosine --thresh 0.9 --memory 4G
+    pysimscale similarity features.npy -o sim_0.npz --shard 0 4 --block-size 1000
+    pysimscale merge sim_0.npz sim_1.npz sim_2.npz sim_3.npz -o sim.npz --labels users.npy
+    pysimscale quotient sim.npz users.npy -o users_sim.npz --agg max
+'''
+import sys
+from argparse import ArgumentParser, ArgumentTypeError
+from timeit import default_timer
+
+MEMORY_UNITS = {'K': 2 ** 10, 'M': 2 ** 20, 'G': 2 ** 30, 'T': 2 ** 40}
+
+
+def parse_memory(s):
+    '''Parse a memory size like `512M` or `4G` (plain numbers are bytes)'''
+    s = s.strip().upper().rstrip('B')
+    try:
+        if s and s[-1] in MEMORY_UNITS:
+            return int(float(s[:-1]) * MEMORY_UNITS[s[-1]])
+        return int(s)
+    except ValueError:
+        raise ArgumentTypeError('Invalid memory size: {}'.format(s))
+
+
+def parse_thresh(s):
+    '''Parse a threshold (`none` means no threshold)'''
+    if s.lower() == 'none':
+        return None
+    try:
+        return float(s)
+    except ValueError:
+        raise ArgumentTypeError('Invalid threshold: {}'.format(s))
+
+
+def parse_top_k(s):
+    '''Parse the number of similarities to keep per row (a positive integer)'''
+    try:
+        k = int(s)
+    except ValueError:
+        raise ArgumentTypeError('Invalid top k: {}'.format(s))
+    if k < 1:
+        raise ArgumentTypeError('Top k must be at least 1: {}'.format(s))
+
+    return k
+
+
+def load_labels(path):
+    '''Load one label per row from a `.npy` file or a text file (one label per line)'''
+    from numpy import load, loadtxt
+
+    if path.endswith('.npy'):
+        return load(path, allow_pickle=False)
+
+    return loadtxt(path, dtype=str, ndmin=1)
+
+
+class Timer:
+    '''Collect and print wall times of the steps of a job'''
+    def __init__(self, quiet=False):
+        self.quiet = quiet
+        self.start = default_timer()
+        self.last = self.start
+
+    def __call__(self, step):
+        now = default_timer()
+        if not self.quiet:
+            print('{}: {:.3f}s'.format(step, now - self.last), file=sys.stderr)
+        self.last = now
+
+    def total(self):
+        if not self.quiet:
+            print('total: {:.3f}s'.format(default_timer() - self.start), file=sys.stderr)
+
+
+def apply_quotient(sim, labels_path, agg, n_jobs, timer):
+    '''Reduce `sim` to the partition induced by the labels file'''
+    from pysimscale.utils import labels2partition
+    from pysimscale.quotient import quotient_similarity
+
+    labels = load_labels(labels_path)
+    if len(labels) != sim.shape[0]:
+        raise ValueError('The labels file has {} rows but the matrix has {}'.format(len(labels), sim.shape[0]))
+    partition, _ = labels2partition(labels)
+    timer('load labels')
+
+    q = quotient_similarity(sim, partition, agg=agg, n_cpu=n_jobs)
+    timer('quotient')
+
+    return q
+
+
+def run_similarity(args):
+    from scipy.sparse import csr_matrix, save_npz
+    from pysimscale.utils import load_features
+    from pysimscale.similarity import check_dtype, truncated_sparse_similarity, block_size_for_memory
+    from pysimscale.shard import shard_range
+
+    timer = Timer(args.quiet)
+    a = check_dtype(load_features(args.input))
+    timer('load features')
+
+    if args.memory is not None:
+        block_size = block_size_for_memory(a.shape[0], args.memory, n_jobs=args.n_jobs)
+    else:
+        block_size = args.block_size
+
+    row_range = None
+    if args.shard is not None:
+        if args.labels is not None:
+            raise ValueError('`--labels` can not be used with `--shard`. Apply the quotient when merging the shards')
+        row_range = shard_range(a.shape[0], args.shard[0], args.shard[1], block_size)
+
+    sim = truncated_sparse_similarity(
+        a, metric=args.metric, block_size=block_size, thresh=args.thresh, diag_value=args.diag_value,
+        binary=args.binary, n_jobs=args.n_jobs, row_range=row_range, top_k=args.top_k, gamma=args.gamma
+    )
+    timer('similarity ({} rows, block size {}, {} non-zeros)'.format(sim.shape[0], block_size, sim.nnz))
+
+    if args.labels is not None:
+        sim = apply_quotient(sim, args.labels, args.agg, args.n_jobs, timer)
+
+    save_npz(args.output, csr_matrix(sim))
+    timer('save')
+    timer.total()
+
+
+def run_merge(args):
+    from scipy.sparse import save_npz
+    from pysimscale.shard import merge_shards
+
+    timer = Timer(args.quiet)
+    sim = merge_shards(args.shards)
+    timer('merge {} shards'.format(len(args.shards)))
+
+    if args.labels is not None:
+        sim = apply_quotient(sim, args.labels, args.agg, args.n_jobs, timer)
+
+    save_npz(args.output, sim)
+    timer('save')
+    timer.total()
+
+
+def run_quotient(args):
+    from scipy.sparse import csr_matrix, load_npz, save_npz
+
+    timer = Timer(args.quiet)
+    sim = load_npz(args.input)
+    timer('load matrix')
+
+    sim = apply_quotient(sim, args.labels, args.agg, args.n_jobs, timer)
+
+    save_npz(args.output, csr_matrix(sim))
+    timer('save')
+    timer.total()
+
+
+def build_parser():
+    parser = ArgumentParser(prog='pysimscale', description='Large scale similarity matrix calculations')
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+
+    common = ArgumentParser(add_help=False)
+    common.add_argument('-o', '--output', required=True, help='Output file (Scipy sparse `.npz` format)')
+    common.add_argument('-j', '--n-jobs', type=int, default=None, help='Number of `joblib` workers. Default is -1 (all CPUs) if `joblib` is installed, otherwise 1')
+    common.add_argument('-q', '--quiet', action='store_true', help='Do not print timings')
+
+    quotient = ArgumentParser(add_help=False)
+    quotient.add_argument('--agg', default='sum', help='Aggregation for the quotient: sum, min, max, mean or getnnz. Default is sum')
+
+    p = sub.add_parser('similarity', parents=[common, quotient], help='Calculate a (thresholded) similarity matrix')
+    p.add_argument('input', help='Features as a `.npy` file (memory-mapped)')
+    p.add_argument('-m', '--metric', default='cosine', help='Built-in metric name: hamming, cosine, jaccard, tanimoto, dot, euclidean or rbf. Default is cosine')
+    p.add_argument('--gamma', type=float, default=None, help='Parameter of the rbf metric. Default is 1 / number of features')
+    p.add_argument('-t', '--thresh', type=parse_thresh, default=0.9, help='Lower threshold for similarity (`none` to disable). Default is 0.9')
+    p.add_argument('-k', '--top-k', type=parse_top_k, default=None, help='Keep only the k highest similarities per row (applied before the threshold)')
+    p.add_argument('--diag-value', type=float, default=0, help='Value of the diagonal. Default is 0')
+    p.add_argument('--binary', action='store_true', help='Output 1/0 instead of the similarity values')
+    size = p.add_mutually_exclusive_group()
+    size.add_argument('-b', '--block-size', type=int, default=1000, help='Rows per block. Default is 1000')
+    size.add_argument('--memory', type=parse_memory, default=None, help='Memory budget for the blocks in flight (e.g. 4G), used to pick the block size')
+    p.add_argument('--shard', type=int, nargs=2, metavar=('I', 'K'), default=None, help='Only calculate shard I out of K (use `merge` to combine the shards)')
+    p.add_argument('--labels', default=None, help='Labels file (`.npy` or one label per line) to apply a quotient to the result')
+    p.set_defaults(func=run_similarity)
+
+    p = sub.add_parser('merge', parents=[common, quotient], help='Merge similarity shards into a single matrix')
+    p.add_argument('shards', nargs='+', help='Shard files, ordered by shard index')
+    p.add_argument('--labels', default=None, help='Labels file (`.npy` or one label per line) to apply a quotient to the result')
+    p.set_defaults(func=run_merge)
+
+    p = sub.add_parser('quotient', parents=[common, quotient], help='Apply a quotient to a similarity matrix')
+    p.add_argument('input', help='Similarity matrix (`.npz` file)')
+    p.add_argument('labels', help='Labels file (`.npy` or one label per line)')
+    p.set_defaults(func=run_quotient)
+
+    return parser
+
+
+def main(argv=None):
+    '''Run the `pysimscale` command line tool. Quotient rows/columns follow the sorted unique labels'''
+    args = build_parser().parse_args(argv)
+
+    if args.n_jobs is None:
+        from pysimscale.parallel import DEFAULT_CPUS
+        args.n_jobs = DEFAULT_CPUS
+
+    try:
+        args.func(args)
+    except (ValueError, TypeError, OSError) as e:
+        print('pysimscale: error: {}'.format(e), file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
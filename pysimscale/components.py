@@ -0,0 +1,103 @@
+from numpy import arange, array, unique, minimum, maximum
+from timeit import default_timer
+from pysimscale.utils import load_features
+from pysimscale.similarity import check_dtype, iter_similarity_blocks
+from pysimscale.parallel import DEFAULT_CPUS
+from pysimscale.stats import lap
+
+
+def find_roots(parent, x):
+    '''Find the root of every index in `x` in the union-find forest `parent`
+
+    Params:
+    - parent: A 1D integer Numpy array. `parent[i]` is the parent of `i` in the forest (roots point to themselves)
+    - x: A 1D integer Numpy array of indices
+
+    Returns a 1D integer Numpy array with the root of each element of `x`
+    '''
+    r = parent[x]
+    while True:
+        rr = parent[r]
+        if (rr == r).all():
+            return r
+        r = rr
+
+
+def union_edges(parent, rows, cols):
+    '''Merge the union-find trees connected by the edges (`rows[i]`, `cols[i]`), in place
+
+    Params:
+    - parent: A 1D integer Numpy array representing a union-find forest (see `find_roots`)
+    - rows, cols: 1D integer Numpy arrays of the same length, each pair representing an edge
+
+    Roots are always linked to the smaller root, so the forest never has cycles. Each round links every edge whose ends are in different trees,
+    and edges that lost a race for the same root are retried in the next round.
+
+    Returns the updated `parent` array
+    '''
+    r, c = rows, cols
+    while r.size > 0:
+        r = find_roots(parent, r)
+        c = find_roots(parent, c)
+        keep = r != c
+        r, c = r[keep], c[keep]
+        if r.size == 0:
+            break
+        lo, hi = minimum(r, c), maximum(r, c)
+        minimum.at(parent, hi, lo)
+        r, c = hi, lo
+
+    # Compress the paths we touched, so the trees stay shallow as blocks are added
+    parent[rows] = find_roots(parent, rows)
+    parent[cols] = find_roots(parent, cols)
+
+    return parent
+
+
+def truncated_connected_components(a, metric='hamming', block_size=1, thresh=0.9, ids=None, n_jobs=DEFAULT_CPUS, dtype_fallback='float64', stats=None, gamma=None):
+    '''Find the connected components of the thresholded similarity graph without building the graph
+
+    Each block from `iter_similarity_blocks` is folded into a union-find forest as soon as it is ready and then discarded, so memory stays O(N)
+    (plus the blocks currently in flight) instead of holding the full sparse similarity matrix.
+
+    Params:
+    - a: A `numpy` matrix / array, `np.memmap` or path to a `.npy` file (see `truncated_sparse_similarity`)
+    - metric: A string with the name of a built in metric or a function (see `similarity_sparse_block`)
+    - block_size: An integer. Maximal number of rows per block. Default is 1
+    - thresh: a lower threshold for similarity. Rows with similarity above the threshold are connected. Default is 0.9
+    - ids: An optional list / array of IDs, one per row. Rows sharing an ID are always in the same component (the "one is enough" approach of
+           `id_block_matrix`, without building the block matrix). IDs do not need to be sorted. Default is None
+    - n_jobs: Number of jobs to be passed to `joblib` (see `truncated_sparse_similarity`)
+    - dtype_fallback: see `truncated_sparse_similarity`
+    - stats: An optional `RunStats` object (see `truncated_sparse_similarity`). Time spent folding blocks is recorded as the `union_find` phase
+    - gamma: Float. Parameter of the `rbf` metric (see `similarity_sparse_block`). Default is None
+
+    Returns a tuple `(n_components, labels)` in the same format as `scipy.sparse.csgraph.connected_components`
+    '''
+    a = check_dtype(load_features(a), dtype_fallback)
+    n = a.shape[0]
+    parent = arange(n)
+
+    if ids is not None:
+        if len(ids) != n:
+            raise ValueError('Length of `ids` must match the number of rows in the array')
+        _, first, inverse = unique(array(ids), return_index=True, return_inverse=True)
+        union_edges(parent, arange(n), first[inverse.ravel()])
+
+    l = list(range(n))
+    blocks = [l[i:(i + block_size)] for i in range(0, n, block_size)]
+
+    timings = stats.phases if stats is not None else None
+    for b, m in zip(blocks, iter_similarity_blocks(a, blocks, n_jobs=n_jobs, metric=metric, thresh=thresh, binary=True, stats=stats, gamma=gamma)):
+        t = default_timer() if stats is not None else None
+        rows = array(b)[m.row]
+        upper = m.col > rows
+        union_edges(parent, rows[upper], m.col[upper])
+        lap(timings, 'union_find', t)
+
+    if stats is not None:
+        stats.update_peak_memory()
+
+    _, labels = unique(find_roots(parent, arange(n)), return_inverse=True)
+
+    return (int(labels.max()) + 1 if n > 0 else 0), labels
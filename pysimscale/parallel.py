@@ -0,0 +1,37 @@
+from importlib.util import find_spec
+from os import cpu_count as os_cpu_count
+from warnings import warn
+
+HAS_JOBLIB = find_spec('joblib') is not None
+DEFAULT_CPUS = -1 if HAS_JOBLIB else 1
+
+
+def use_joblib(n_jobs):
+    '''Should a calculation with `n_jobs` workers be sent to `joblib`?
+
+    Returns False for `n_jobs == 1`, and also when `joblib` is not installed (with a `RuntimeWarning`, since parallelisation was requested)
+    '''
+    if n_jobs == 1:
+        return False
+
+    if not HAS_JOBLIB:
+        warn('Could not find `joblib` library. Falling back to simple loops', RuntimeWarning, stacklevel=3)
+        return False
+
+    return True
+
+
+def joblib_backend():
+    '''Import `joblib` on first use. Returns the `(Parallel, delayed)` pair'''
+    from joblib import Parallel, delayed
+
+    return Parallel, delayed
+
+
+def cpu_count():
+    '''Number of CPUs, as seen by `joblib` when it is installed'''
+    if HAS_JOBLIB:
+        from joblib import cpu_count as joblib_cpu_count
+        return joblib_cpu_count()
+
+    return os_cpu_count() or 1
@@ -1,45 +1,96 @@
-from pysimscale import is_partition
-from scipy.sparse import vstack, csr_matrix
-from importlib.util import find_spec
-
-if find_spec('joblib') is not None:
-    from joblib import Parallel, delayed
-    DEFAULT_CPUS = -1
-else:
-    print('Could not find `joblib` library. Parallelisation is disabled by default')
-    DEFAULT_CPUS = 1
+from numpy import array, ones, arange, repeat
+from scipy.sparse import vstack, csr_matrix, diags
+from timeit import default_timer
+from pysimscale.utils import is_partition
+from pysimscale.stats import lap
+from pysimscale.symmetric import SymmetricSparse
+from pysimscale.parallel import DEFAULT_CPUS, use_joblib, joblib_backend
 
 MATRIX_METHOD_STR = ('sum', 'min', 'max', 'mean', 'getnnz')
 MATRIX_METHOD_STR_ERR = 'Unknown string for aggregation method. Please pick one of (' + ','.join(MATRIX_METHOD_STR) + ') or specify a function'
 
 
-def merge_row_partition(m, partition, agg, n_cpu):
+def merge_row_partition(m, partition, agg, n_cpu, stats=None):
     '''Merge rows in a symmetric similarity matrix according to a partition
 
     Params:
     - m: A symmetric 2D array (can be sparse) containing the similarity matrix
     - partition: A list-of-lists partitionning the rows of `m`
     - agg: a function that takes as parameters the matrix and a range of indices from the partition and aggregates the values across the rows
+    - stats: An optional `RunStats` object. Each part of the partition counts as a block, and the `aggregate` / `vstack` phases are timed. Default is None
 
     Returns a similarity matrix reduced to the dimension induced by the partition
     '''
-    if n_cpu == 1:
-        m_merged = [agg(m, p) for p in partition]
+    if not use_joblib(n_cpu):
+        m_merged = _record_parts((agg(m, p) for p in partition), len(partition), stats)
     else:
-        with Parallel(n_jobs=n_cpu) as p:
-            m_merged = vstack(p(delayed(agg)(m, p) for p in partition))
+        Parallel, delayed = joblib_backend()
+        with Parallel(n_jobs=n_cpu, return_as='generator') as p:
+            m_merged = _record_parts(p(delayed(agg)(m, part) for part in partition), len(partition), stats)
+
+    if stats is None:
+        return(vstack(m_merged))
+
+    with stats.phase('vstack'):
+        return(vstack(m_merged))
+
+
+def _record_parts(parts, n_parts, stats):
+    '''Collect the aggregated rows from `parts` into a list, recording each one in `stats` (if given) as it completes'''
+    if stats is None:
+        return list(parts)
+
+    stats.start(n_parts)
+    result = []
+    t = default_timer()
+    for part in parts:
+        t = lap(stats.phases, 'aggregate', t)
+        stats.block_done(nnz=getattr(part, 'nnz', None))
+        result.append(part)
+        t = default_timer()
 
-    return(vstack(m_merged))
+    return result
+
+
+def symmetric_sum_quotient(m, partition, stats=None):
+    '''Sum quotient of a `SymmetricSparse` matrix, computed from its upper triangle U as P U P^T + (P U P^T)^T - diag(P diag(U))
 
+    Params:
+    - m: A `SymmetricSparse` similarity matrix
+    - partition: A list-of-lists partitionning the rows/columns of `m`
+    - stats: An optional `RunStats` object (recorded as the `aggregate` phase). Default is None
 
-def quotient_similarity(m, partition, agg='sum', diag_value=None, check=False, n_cpu=DEFAULT_CPUS):
+    Returns a sparse CSR similarity matrix reduced to the dimension induced by the partition
+    '''
+    t = default_timer() if stats is not None else None
+
+    # Rows that are not in any part are left out (same as `merge_row_partition`)
+    rows = array([i for part in partition for i in part], dtype='int64')
+    parts = repeat(arange(len(partition)), [len(part) for part in partition])
+    # Same result type as summing the values (e.g. int32 and bool sum to int64), like the CSR path
+    dtype = m.data[:0].sum().dtype
+    p = csr_matrix((ones(len(rows), dtype=dtype), (parts, rows)), shape=(len(partition), m.shape[0]))
+    u = m.upper().astype(dtype, copy=False)
+
+    q = p @ u @ p.T
+    result = csr_matrix(q + q.T - diags(p @ u.diagonal(), format='csr', dtype=dtype))
+
+    if stats is not None:
+        lap(stats.phases, 'aggregate', t)
+
+    return result
+
+
+def quotient_similarity(m, partition, agg='sum', diag_value=None, check=False, n_cpu=DEFAULT_CPUS, stats=None):
     '''Generate quotient similarity matrix based on the given partition of matrix rows
 
     Params:
-    - m: A symmetric 2D array (can be sparse) containing the similarity matrix
+    - m: A symmetric 2D array (can be sparse or `SymmetricSparse`) containing the similarity matrix. With `SymmetricSparse` and `agg='sum'` the
+         quotient is calculated directly from the stored triangle, other aggregations convert it to a full CSR matrix first
     - partition: A list-of-lists partitionning the rows/columns of `m`
     - agg: One of ('sum', 'min'. 'max', 'mean', 'getnnz') or a function that takes as parameters the matrix and a range of indices from the partition and aggregates the values across the rows
     - check: Logical. Should the dunction check that `partition` is a valid partition of the rows of m? Default is 'True'
+    - stats: An optional `RunStats` object recording per-phase wall time, parts done (for both the row and the column pass) and peak memory. Default is None
 
     Returns a similarity matrix reduced to the dimension induced by the partition
     '''
@@ -58,11 +109,24 @@ def quotient_similarity(m, partition, agg='sum', diag_value=None, check=False, n
         if not is_partition(partition, start=0, end=m.shape[0]-1):
             raise ValueError('Please provide a proper partition')
 
-    result = merge_row_partition(merge_row_partition(m, partition, f_agg, n_cpu).T, partition, f_agg, n_cpu)
+    if isinstance(m, SymmetricSparse) and agg == 'sum':
+        result = symmetric_sum_quotient(m, partition, stats)
+    else:
+        if isinstance(m, SymmetricSparse):
+            m = m.tocsr()
+        result = merge_row_partition(merge_row_partition(m, partition, f_agg, n_cpu, stats).T, partition, f_agg, n_cpu, stats)
+
+    timings = stats.phases if stats is not None else None
+    t = default_timer() if stats is not None else None
 
     if diag_value is not None:
         result.setdiag(diag_value)
+        t = lap(timings, 'setdiag', t)
 
     result.eliminate_zeros()
+    lap(timings, 'eliminate_zeros', t)
+
+    if stats is not None:
+        stats.update_peak_memory()
 
     return result
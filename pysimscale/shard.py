@@ -0,0 +1,62 @@
+from math import ceil
+from scipy.sparse import csr_matrix, load_npz, save_npz, vstack
+from pysimscale.utils import load_features
+from pysimscale.similarity import truncated_sparse_similarity
+
+
+def shard_range(n_rows, shard, n_shards, block_size=1):
+    '''Row range of a single shard when splitting a similarity calculation across processes / machines
+
+    Params:
+    - n_rows: Integer. Total number of rows in the feature array
+    - shard: Integer. Index of the shard (0 to `n_shards - 1`)
+    - n_shards: Integer. Total number of shards
+    - block_size: Integer. Shards are aligned on block boundaries, so the blocks are the same as in a single run. Default is 1
+
+    Returns a tuple `(start, end)` that can be passed as `row_range` to `truncated_sparse_similarity`
+    '''
+    if not 0 <= shard < n_shards:
+        raise ValueError('`shard` must be between 0 and `n_shards - 1`')
+
+    n_blocks = ceil(n_rows / block_size)
+    start = (shard * n_blocks // n_shards) * block_size
+    end = ((shard + 1) * n_blocks // n_shards) * block_size
+
+    return min(start, n_rows), min(end, n_rows)
+
+
+def similarity_shard(a, path, shard, n_shards, block_size=1, **kwargs):
+    '''Calculate a single shard of the similarity matrix and save it to disk
+
+    Params:
+    - a: A Numpy array, `np.memmap` or a path to a `.npy` file (memory-mapped, so all the shards can read the same file)
+    - path: Where to save the shard (Scipy `.npz` format, see `scipy.sparse.save_npz`)
+    - shard: Integer. Index of the shard (0 to `n_shards - 1`)
+    - n_shards: Integer. Total number of shards
+    - block_size: Integer. See `truncated_sparse_similarity`
+    - kwargs: Passed to `truncated_sparse_similarity` (metric, thresh, n_jobs etc.)
+
+    Returns the row range `(start, end)` covered by the shard
+    '''
+    a = load_features(a)
+    row_range = shard_range(a.shape[0], shard, n_shards, block_size)
+    sim = truncated_sparse_similarity(a, block_size=block_size, row_range=row_range, **kwargs)
+    save_npz(path, csr_matrix(sim))
+
+    return row_range
+
+
+def merge_shards(paths):
+    '''Combine similarity shards (see `similarity_shard`) into a single matrix
+
+    Params:
+    - paths: A list of paths to the shards, ordered by shard index
+
+    Returns a sparse CSR similarity matrix
+    '''
+    sim = csr_matrix(vstack([load_npz(p) for p in paths]))
+
+    if sim.shape[0] != sim.shape[1]:
+        raise ValueError('Shards do not add up to a square matrix. Are all the shards listed (in order)?')
+
+    return sim
@@ -1,5 +1,6 @@
 from scipy.sparse import coo_matrix
-from pysimscale import is_permutation
+from pysimscale.utils import is_permutation
+from pysimscale.symmetric import SymmetricSparse
 
 
 def row_shuffle_matrix(permutation):
@@ -17,11 +18,12 @@ def sim_matrix_shuffle(m, row_order, check=True):
     '''Re-arrange a similarity matrix based on a new row order
 
     Params:
-    - m: Similarity matrix. Can be dense (Numpy array / matrix) or sparse (as long as it supports arithmetic operations)
+    - m: Similarity matrix. Can be dense (Numpy array / matrix), sparse (as long as it supports arithmetic operations) or `SymmetricSparse`
     - row_order: A list of integers, which makes a permutation of the matrix rows
     - check: Should the permutation be checked before creating the matrix (can be turned off in case you are sure and want to save some time)
 
-    Returns: A re-ordered similarity matrix (type depends on the input type. Sparse should return sparse)
+    Returns: A re-ordered similarity matrix, where the new row / column `i` is the old row / column `row_order[i]` (type depends on the input type.
+    Sparse should return sparse, `SymmetricSparse` returns `SymmetricSparse`)
     '''
     if check:
         if not m.shape[0] == len(row_order):
@@ -29,6 +31,9 @@ def sim_matrix_shuffle(m, row_order, check=True):
         if not is_permutation(row_order):
             raise ValueError('''`row_order` is not a permutation''')
 
+    if isinstance(m, SymmetricSparse):
+        return m.permute(row_order)
+
     sh = row_shuffle_matrix(row_order)
 
-    return sh * m * sh
+    return sh * m * sh.T
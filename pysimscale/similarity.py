@@ -1,58 +1,250 @@
-from importlib.util import find_spec
-from scipy.sparse import coo_matrix, vstack
-from numpy import matmul, isnan, clip
-from numpy.linalg import norm
+from scipy.sparse import coo_matrix, vstack, issparse
+from numpy import isnan, clip, argpartition, put_along_axis, asarray, einsum, sqrt, exp, divide, zeros_like, zeros
 from math import ceil
+from functools import partial
+from timeit import default_timer
+from pysimscale.utils import load_features
+from pysimscale.stats import lap, timed_block
+from pysimscale.symmetric import SymmetricSparse
+from pysimscale.parallel import DEFAULT_CPUS, HAS_JOBLIB, use_joblib, joblib_backend, cpu_count
 
-if find_spec('joblib') is not None:
-    from joblib import Parallel, delayed, cpu_count
-    DEFAULT_CPUS = -1
-else:
-    print('Could not find `joblib` library. Parallelisation is disabled by default')
-    DEFAULT_CPUS = 1
+BUILTIN_METRICS = ('hamming', 'cosine', 'jaccard', 'tanimoto', 'dot', 'euclidean', 'rbf')
 
-def similarity_sparse_block(a, ind_range, thresh, metric='hamming', binary=False, sparse=True, normalized=True):
-    '''Calculate a Hamming similarity matrix (1 - distance) for a subset of indices (against the entire dataset).
+
+def check_dtype(a, dtype_fallback='float64'):
+    '''Make sure `a` has one of the supported types (`boolean`, `int32/64`, `float32/64`), converting it to `dtype_fallback` otherwise'''
+    if a.dtype not in ('bool', 'int32', 'int64', 'float32', 'float64'):
+        try:
+            a = a.astype(dtype_fallback)
+        except TypeError:
+            raise TypeError('Supported data types are `boolean`, `int32`, `int64`, `float32`, `float64`. Do all of your lines have the same number of items? Maybe there is `None` hiding somewhere? If this is a Pandase series Try using `allign2Darray`')
+
+    return a
+
+
+def row_sums(a):
+    '''Sum of each row of `a` (dense or Scipy sparse) as a 1D `float64` array'''
+    return asarray(a.sum(axis=1), dtype='float64').ravel()
+
+
+def row_sq_norms(a):
+    '''Squared L2 norm of each row of `a` (dense or Scipy sparse) as a 1D `float64` array'''
+    if issparse(a):
+        return asarray(a.multiply(a).sum(axis=1), dtype='float64').ravel()
+    if a.dtype == 'bool':
+        return row_sums(a)
+
+    return einsum('ij,ij->i', a, a, dtype='float64')
+
+
+def metric_preprocess(a, metric):
+    '''Per-row quantities used by a built-in metric, calculated once and shared by all the blocks
+
+    Params:
+    - a: A 2D Numpy array (or Scipy sparse matrix), each row representing an embedding vector
+    - metric: A string with the name of a built in metric (see `similarity_sparse_block`)
+
+    Returns a dict of 1D arrays (O(N) memory) to be passed as `precomputed` to `similarity_sparse_block`
+    '''
+    if metric == 'hamming':
+        return {'sums': row_sums(a)}
+    elif metric == 'cosine':
+        return {'norms': sqrt(row_sq_norms(a))}
+    elif metric in ('jaccard', 'tanimoto', 'euclidean', 'rbf'):
+        return {'sq_norms': row_sq_norms(a)}
+
+    return {}
+
+
+def block_dot(a, ind_range):
+    '''Dense matrix of dot products between the rows `ind_range` and all the rows of `a` (dense or Scipy sparse)'''
+    x = a[ind_range]
+    if x.dtype.kind != 'f':
+        # Integer matmul does not use BLAS (and boolean matmul is a logical "or"), so cast the block and let Numpy promote `a`
+        x = x.astype('float64')
+    m = x @ a.T
+
+    return m.toarray() if issparse(m) else asarray(m)
+
+
+def similarity_sparse_block(a, ind_range, thresh, metric='hamming', binary=False, sparse=True, normalized=True, top_k=None, timings=None, precomputed=None, gamma=None):
+    '''Calculate a similarity matrix for a subset of indices (against the entire dataset).
 
     params:
-    - a: A 2D Numpy array, each row representing an embedding vector
+    - a: A 2D Numpy array, each row representing an embedding vector. Built-in metrics also accept a Scipy sparse CSR matrix
     - ind_range: A list of integers representing the subset of chosen indices
-    - metric: A string with the name of a built in metric (currently `cosine` and `hamming` are supported) or a function that takes two matrices and returns row-wise distnaces
+    - metric: A string with the name of a built in metric or a function that takes two matrices and returns row-wise distnaces. Built-in metrics are:
+              * `hamming`: 1 - Hamming distance (share of equal features, for binary data)
+              * `cosine`: Cosine similarity
+              * `jaccard` / `tanimoto`: x.y / (|x|^2 + |y|^2 - x.y). Jaccard similarity for binary data, Tanimoto coefficient for real values
+              * `dot`: Raw dot product
+              * `euclidean`: 1 / (1 + Euclidean distance)
+              * `rbf`: RBF (Gaussian) kernel exp(-gamma * |x - y|^2)
+              All of them are calculated from a single matrix product of the block with `a` and per-row quantities (see `metric_preprocess`)
     - thresh: a lower threshold for similarity. Values below wll be set to 0. Default is None (no filtering)
     - binary: Should the result be a 1/0 matrix (is the similarity above or below threshold) or return the actual similarities. Default is `False`
     - sparse: Should the returned matrix be a Scipy COO matrix. Default is True
     - normalized: Are the rows of the array normalized? (used only to decide if we normalize when calculating cosine similarity)
+    - top_k: A positive integer. Keep only the `top_k` highest similarities in each row (the similarity of a row with itself is counted). Applied before `thresh`. Default is None (keep all)
+    - timings: An optional dict. When given, the wall time of each phase (`matmul`, `threshold`, `coo`) is added to it. Default is None (no timing)
+    - precomputed: The output of `metric_preprocess(a, metric)`, so it can be calculated once for all the blocks. Default is None (calculate it for this block)
+    - gamma: Float. Parameter of the `rbf` metric. Default is None, which means `1 / n_features`
     '''
-    if metric == 'hamming':
-        m = (1.0 * matmul(a[ind_range], a.T) + matmul((1 - a[ind_range]), (1 - a).T)) / a.shape[1]
-    elif metric == 'cosine':
-        if normalized:
-            a = a / norm(a, ord=2, axis=1).reshape(a.shape[0], 1)
-        m = matmul(a[ind_range], a.T)
-    elif callable(metric):
+    if top_k is not None and top_k < 1:
+        raise ValueError('`top_k` must be a positive integer (or None to keep all)')
+
+    t = default_timer() if timings is not None else None
+
+    if callable(metric):
         m = metric(a[ind_range], a)
+    elif metric in BUILTIN_METRICS:
+        if precomputed is None:
+            precomputed = metric_preprocess(a, metric)
+        m = block_dot(a, ind_range)
+
+        if metric == 'hamming':
+            # Equal features are x.y + (1 - x).(1 - y) = 2 x.y - sum(x) - sum(y) + n_features
+            s = precomputed['sums']
+            m = (2.0 * m - s[ind_range].reshape(-1, 1) - s + a.shape[1]) / a.shape[1]
+        elif metric == 'cosine':
+            if normalized:
+                n = precomputed['norms']
+                m = m / n[ind_range].reshape(-1, 1) / n
+            else:
+                m = 1.0 * m
+        elif metric == 'dot':
+            m = 1.0 * m
+        else:
+            sq = precomputed['sq_norms']
+            sq_sum = sq[ind_range].reshape(-1, 1) + sq
+            if metric in ('jaccard', 'tanimoto'):
+                denom = sq_sum - m
+                m = divide(m, denom, out=zeros_like(denom), where=denom != 0)
+            else:
+                # |x - y|^2 = |x|^2 + |y|^2 - 2 x.y (clipped, since rounding can make it slightly negative)
+                d2 = clip(sq_sum - 2.0 * m, 0, None)
+                if metric == 'euclidean':
+                    m = 1.0 / (1.0 + sqrt(d2))
+                else:
+                    m = exp(-(1.0 / a.shape[1] if gamma is None else gamma) * d2)
     else:
         raise ValueError('Invalid value of `metric` parameter. Please use one of the built-in options of specify a function (see documentation)')
 
+    t = lap(timings, 'matmul', t)
 
-    if thresh is not None:
-        if binary:
-            m = (m >= thresh).astype(int)
-        else:
+    keep = None
+    if top_k is not None and top_k < m.shape[1]:
+        # A mask rather than zeros, since a zero passes a threshold <= 0 when the output is binary
+        keep = zeros(m.shape, dtype='bool')
+        put_along_axis(keep, argpartition(m, -top_k, axis=1)[:, -top_k:], True, axis=1)
+
+    if thresh is not None and binary:
+        m = m >= thresh
+        if keep is not None:
+            m &= keep
+        m = m.astype(int)
+    else:
+        if keep is not None:
+            m[~keep] = 0
+        if thresh is not None:
             m[m < thresh] = 0
 
+    t = lap(timings, 'threshold', t)
+
     if sparse:
         m = coo_matrix(m)
+        lap(timings, 'coo', t)
 
     return m
 
 
-def truncated_sparse_similarity(a, metric='hamming', block_size=1, thresh=0.9, diag_value=0, binary=False, n_jobs=DEFAULT_CPUS, dtype_fallback='float64'):
+def block_size_for_memory(n_rows, memory, n_jobs=DEFAULT_CPUS, itemsize=8, copies=3):
+    '''Largest block size that keeps the dense blocks in flight under a memory budget
+
+    Params:
+    - n_rows: Integer. Number of rows in the feature array (each block row holds a similarity against all of them)
+    - memory: Integer. Memory budget in bytes, shared by all workers
+    - n_jobs: Number of `joblib` jobs (see `truncated_sparse_similarity`). Negative values are resolved with `joblib.cpu_count`
+    - itemsize: Integer. Bytes per similarity value. Default is 8 (`float64`)
+    - copies: Integer. Number of dense block-sized arrays a metric keeps alive at the same time. Default is 3 (Hamming similarity)
+
+    Returns an integer block size (at least 1)
+    '''
+    if not HAS_JOBLIB:
+        n_jobs = 1
+    elif n_jobs < 0:
+        n_jobs = max(cpu_count() + 1 + n_jobs, 1)
+
+    return max(int(memory // (n_rows * itemsize * copies * n_jobs)), 1)
+
+
+def iter_similarity_blocks(a, blocks, n_jobs=DEFAULT_CPUS, stats=None, upper=False, **kwargs):
+    '''Generate the similarity blocks of `a` one at a time, in the order of `blocks`
+
+    Params:
+    - a: A 2D Numpy array, each row representing an embedding vector
+    - blocks: A list of lists of integers, each representing the row indices of a single block
+    - n_jobs: Number of jobs to be passed to `joblib` (see `truncated_sparse_similarity`)
+    - stats: An optional `RunStats` object, updated with the phase times, non-zeros and peak memory of each block as it completes. Default is None
+    - upper: Should only the upper triangle (column >= row, including the diagonal) of each block be kept? Non-zeros are recorded in `stats` after trimming. Default is False
+    - kwargs: Passed on to `similarity_sparse_block` (metric, thresh, binary etc.). For built-in metrics, non-float arrays are cast to `float64` and the
+              per-row quantities are calculated once here (see `metric_preprocess`)
+
+    Yields sparse COO blocks as soon as they are ready, so callers can fold them into a smaller result without holding all of them in memory
+    '''
+    metric = kwargs.get('metric', 'hamming')
+    if isinstance(metric, str) and metric in BUILTIN_METRICS:
+        t = default_timer()
+        if a.dtype.kind != 'f':
+            # Cast once for the whole run, otherwise `block_dot` promotes all of `a` to float in every block
+            a = a.astype('float64')
+        if kwargs.get('precomputed') is None:
+            kwargs['precomputed'] = metric_preprocess(a, metric)
+        if stats is not None:
+            lap(stats.phases, 'preprocess', t)
+
+    if stats is None:
+        f = similarity_sparse_block
+    else:
+        stats.start(len(blocks))
+        f = partial(timed_block, similarity_sparse_block)
+
+    if not use_joblib(n_jobs):
+        results = (f(a=a, ind_range=b, **kwargs) for b in blocks)
+        for b, m in zip(blocks, results):
+            yield _record_block(m, stats, b if upper else None)
+    else:
+        Parallel, delayed = joblib_backend()
+        with Parallel(n_jobs=n_jobs, return_as='generator') as p:
+            for b, m in zip(blocks, p(delayed(f)(a=a, ind_range=b, **kwargs) for b in blocks)):
+                yield _record_block(m, stats, b if upper else None)
+
+
+def _record_block(m, stats, rows=None):
+    '''Unpack a (block, timings) pair from `timed_block` into `stats`, returning the block
+
+    When `rows` (the row indices of the block) is given, only the upper triangle of the COO block is kept, before its non-zeros are recorded
+    '''
+    if stats is not None:
+        m, timings = m
+
+    if rows is not None:
+        keep = m.col >= asarray(rows)[m.row]
+        m = coo_matrix((m.data[keep], (m.row[keep], m.col[keep])), shape=m.shape)
+
+    if stats is not None:
+        stats.block_done(nnz=getattr(m, 'nnz', None), timings=timings)
+
+    return m
+
+
+def truncated_sparse_similarity(a, metric='hamming', block_size=1, thresh=0.9, diag_value=0, binary=False, n_jobs=DEFAULT_CPUS, dtype_fallback='float64', row_range=None, top_k=None, stats=None, gamma=None, symmetric=False):
     '''Calculate similarity measures between rows of a 2D Numpy array or a Pandas series of lists
 
     Params:
-    - a: A `numpy` matrix / array with one of the following types: `boolean`, `int32/64`, `float32/64`. All rows must have the same number of elements (you can use `simscale.util.allign2Darray` to ensure that)
-    - metric: A string with the name of a built in metric (currently `cosine` and `hamming` are supported) or a function that takes two matrices and returns row-wise distnaces
+    - a: A `numpy` matrix / array with one of the following types: `boolean`, `int32/64`, `float32/64`. All rows must have the same number of elements (you can use `simscale.util.allign2Darray` to ensure that).
+         Can also be an `np.memmap` or a path to a `.npy` file, which is memory-mapped (see `load_features`), or a Scipy sparse CSR matrix (built-in metrics only)
+    - metric: A string with the name of a built in metric (`hamming`, `cosine`, `jaccard` / `tanimoto`, `dot`, `euclidean` or `rbf`, see `similarity_sparse_block`) or a function that takes two matrices and returns row-wise distnaces
     - block_size: An integer. Maximal number of rows per block when breaking down the similarity calculation int o components. Default is 1, which means we calculate similarity one row at a time (against all other rows).
     - thresh: a lower threshold for similarity. Values under threshold are set to 0. Default is 0.9
     - diag_value: What value should be assigned to the diagonal (`None` means no assignment). Default is 0
@@ -64,35 +256,48 @@ def truncated_sparse_similarity(a, metric='hamming', block_size=1, thresh=0.9, d
               * Not installed: Default is 1, which means simple python loops.
               * You can force a number at your own risk
     - dtype_fallback: if the array's `dtype` is not `boolean`, `int32/64`, `float32/64` then the function will try and convert the array to this type. Defaults to `float64` which should cover most cases (but is not very memory efficient)
+    - row_range: A tuple `(start, end)`. Only calculate the similarity of rows `start` to `end - 1` against all rows (see `shard_range`). Default is None (all rows)
+    - top_k: A positive integer. Keep only the `top_k` highest similarities in each row, before thresholding (see `similarity_sparse_block`). Note that the result is no longer symmetric. Default is None (keep all)
+    - stats: An optional `RunStats` object recording per-phase wall time, blocks done, non-zeros per block and peak memory (see `RunStats`). Default is None (no instrumentation)
+    - gamma: Float. Parameter of the `rbf` metric (see `similarity_sparse_block`). Default is None, which means `1 / n_features`
+    - symmetric: Should the result be a `SymmetricSparse` matrix? Only the upper triangle of each block is kept as it completes, which halves the
+                 memory of the result. Can not be combined with `row_range` or `top_k`. Default is False
 
-    Returns a sparse similarity matrix
+    Returns a sparse similarity matrix (`SymmetricSparse` if `symmetric` is True). When `row_range` is given the matrix has only `end - start` rows (and the diagonal is shifted accordingly)
     '''
-    if a.dtype not in ('bool', 'int32', 'int64', 'float32', 'float64'):
-        try:
-            a = a.astype(dtype_fallback)
-        except TypeError:
-            raise TypeError('Supported data types are `boolean`, `int32`, `int64`, `float32`, `float64`. Do all of your lines have the same number of items? Maybe there is `None` hiding somewhere? If this is a Pandase series Try using `allign2Darray`')
-
+    if symmetric and (row_range is not None or top_k is not None):
+        raise ValueError('`symmetric` can not be combined with `row_range` or `top_k`')
+    if top_k is not None and top_k < 1:
+        raise ValueError('`top_k` must be a positive integer (or None to keep all)')
 
+    a = check_dtype(load_features(a), dtype_fallback)
 
-    l = list(range(a.shape[0]))
-    blocks = [l[i:(i + block_size)] for i in range(0, a.shape[0], block_size)]
+    if row_range is None:
+        start, end = 0, a.shape[0]
+    else:
+        start, end = row_range
 
-    if n_jobs == 1 or DEFAULT_CPUS == 1:
-        if DEFAULT_CPUS == 1 and n_jobs != 1:
-            print('Could not find `joblib` library. Falling back to simple loops')
+    l = list(range(start, end))
+    blocks = [l[i:(i + block_size)] for i in range(0, end - start, block_size)]
 
-        sim = [similarity_sparse_block(a=a, ind_range=b, metric=metric, thresh=thresh, binary=binary) for b in blocks]
-    else:
-        with Parallel(n_jobs=n_jobs) as p:
-            f = delayed(similarity_sparse_block)
-            sim = p(f(a=a, ind_range=b, metric=metric, thresh=thresh, binary=binary) for b in blocks)
+    sim = list(iter_similarity_blocks(a, blocks, n_jobs=n_jobs, metric=metric, thresh=thresh, binary=binary, top_k=top_k, stats=stats, gamma=gamma, upper=symmetric))
 
-    sim = vstack(sim)
+    timings = stats.phases if stats is not None else None
+    t = default_timer() if stats is not None else None
+    sim = vstack(sim) if len(sim) > 0 else coo_matrix((0, a.shape[0]))
+    t = lap(timings, 'vstack', t)
 
     if diag_value is not None:
-        sim.setdiag(diag_value)
+        sim.setdiag(diag_value, k=start)
+        t = lap(timings, 'setdiag', t)
 
     sim.eliminate_zeros()
+    lap(timings, 'eliminate_zeros', t)
+
+    if stats is not None:
+        stats.update_peak_memory()
+
+    if symmetric:
+        return SymmetricSparse.from_upper(sim)
 
     return sim
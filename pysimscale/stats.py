@@ -0,0 +1,127 @@
+from contextlib import contextmanager
+from importlib.util import find_spec
+from sys import platform
+from timeit import default_timer
+
+if find_spec('resource') is not None:
+    from resource import getrusage, RUSAGE_SELF
+    HAS_RESOURCE = True
+else:
+    HAS_RESOURCE = False
+
+
+def peak_memory():
+    '''Peak resident memory of the current process in bytes (`None` if the platform does not report it)'''
+    if not HAS_RESOURCE:
+        return None
+
+    # Linux reports kilobytes, macOS reports bytes
+    return getrusage(RUSAGE_SELF).ru_maxrss * (1 if platform == 'darwin' else 1024)
+
+
+class RunStats:
+    '''Opt-in instrumentation for long similarity / quotient runs
+
+    Pass an instance as the `stats` parameter of `truncated_sparse_similarity`, `truncated_connected_components`, `quotient_similarity` or
+    `merge_row_partition`. Functions only record anything when a `RunStats` is given, so the default (`stats=None`) adds no overhead.
+
+    Attributes:
+    - phases: A dict mapping a phase name (`matmul`, `threshold`, `coo`, `vstack`, `setdiag`, `eliminate_zeros`, `aggregate` ...) to wall time in seconds.
+              Block phases run in the workers and are summed across blocks, so with several workers they can add up to more than the elapsed time
+    - blocks_done: Number of blocks (or partition parts) completed so far
+    - n_blocks: Total number of blocks expected in the current run (`None` until known)
+    - nnz_per_block: A list with the number of non-zeros produced by each block, in completion order
+    - peak_memory: Peak resident memory in bytes, across this process and the workers that reported it
+    - callback: An optional function called with the `RunStats` object after every completed block (e.g. to print progress)
+    '''
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.phases = {}
+        self.blocks_done = 0
+        self.n_blocks = None
+        self.nnz_per_block = []
+        self.peak_memory = None
+
+    def add_phase(self, name, seconds):
+        '''Add `seconds` of wall time to phase `name`'''
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        '''Context manager that times the enclosed code as phase `name`'''
+        start = default_timer()
+        try:
+            yield self
+        finally:
+            self.add_phase(name, default_timer() - start)
+
+    def update_peak_memory(self, value=None):
+        '''Record a peak memory reading (defaults to the current process)'''
+        if value is None:
+            value = peak_memory()
+        if value is not None and (self.peak_memory is None or value > self.peak_memory):
+            self.peak_memory = value
+
+    def start(self, n_blocks):
+        '''Announce the number of blocks of the next run (counters are cumulative across runs)'''
+        self.n_blocks = n_blocks if self.n_blocks is None else self.n_blocks + n_blocks
+
+    def block_done(self, nnz=None, timings=None):
+        '''Record a completed block
+
+        Params:
+        - nnz: Number of non-zeros produced by the block (not recorded if None)
+        - timings: A dict of phase times measured while calculating the block. A `peak_memory` key is treated as a memory reading (see `timed_block`)
+        '''
+        if timings is not None:
+            for name, seconds in timings.items():
+                if name == 'peak_memory':
+                    if seconds is not None:
+                        self.update_peak_memory(seconds)
+                else:
+                    self.add_phase(name, seconds)
+        if nnz is not None:
+            self.nnz_per_block.append(nnz)
+        self.blocks_done += 1
+
+        if self.callback is not None:
+            self.callback(self)
+
+    def as_dict(self):
+        '''Summary as a plain (JSON serialisable) dict'''
+        self.update_peak_memory()
+        return {
+            'phases': dict(self.phases),
+            'blocks_done': self.blocks_done,
+            'n_blocks': self.n_blocks,
+            'nnz': sum(self.nnz_per_block),
+            'nnz_per_block': list(self.nnz_per_block),
+            'peak_memory': self.peak_memory
+        }
+
+    def __repr__(self):
+        phases = ', '.join('{}={:.3f}s'.format(k, v) for k, v in self.phases.items())
+        return 'RunStats(blocks={}/{}, nnz={}, {})'.format(self.blocks_done, self.n_blocks, sum(self.nnz_per_block), phases)
+
+
+def lap(timings, name, start):
+    '''Add the time since `start` to `timings[name]` and return the current time. Does nothing (and returns None) when `timings` is None'''
+    if timings is None:
+        return None
+
+    now = default_timer()
+    timings[name] = timings.get(name, 0.0) + now - start
+
+    return now
+
+
+def timed_block(f, *args, **kwargs):
+    '''Call `f(*args, timings=timings, **kwargs)` and return both the result and the `timings` dict it filled in
+
+    Used to bring the phase times of a block back from a `joblib` worker, together with the worker's peak memory.
+    '''
+    timings = {}
+    result = f(*args, timings=timings, **kwargs)
+    timings['peak_memory'] = peak_memory()
+
+    return result, timings
@@ -0,0 +1,141 @@
+from numpy import argsort, asarray, concatenate, cumsum, bincount, minimum, maximum, empty_like, arange, searchsorted
+from scipy.sparse import csr_matrix, coo_matrix, triu
+
+
+class SymmetricSparse:
+    '''Symmetric sparse matrix that stores only its upper triangle (including the diagonal)
+
+    The triangle is kept in compact CSR arrays (`data`, `indices`, `indptr`), which takes about half the memory of a full CSR / COO matrix
+    holding both (i, j) and (j, i). Use `from_matrix` to build one from any (symmetric) matrix, or `truncated_sparse_similarity(..., symmetric=True)`
+    to build one without ever holding the full matrix.
+
+    Supports:
+    - `neighbours(i)`: non-zero columns and values of row `i`. The first call builds a column index of the triangle (one position per stored
+      value, in the dtype of `indices`, so about a third more memory for `float64` data), later calls are O(row length x log N)
+    - `dot(x)` / `m @ x`: matrix-vector (or matrix-matrix) products, without building the full matrix
+    - `permute(order)`: re-order rows and columns (see `sim_matrix_shuffle`)
+    - `tocsr()`, `toarray()`, `todense()`: conversion to a full matrix on demand
+
+    `quotient_similarity` and `sim_matrix_shuffle` accept it as input.
+    '''
+    def __init__(self, data, indices, indptr, shape):
+        '''Build from the CSR arrays of the upper triangle (no copy is made, and the arrays are not checked)'''
+        self.data = data
+        self.indices = indices
+        self.indptr = indptr
+        self.shape = shape
+        self._columns = None
+
+    @classmethod
+    def from_matrix(cls, m, check=False):
+        '''Build from a symmetric matrix (dense or sparse), keeping only its upper triangle
+
+        Params:
+        - m: A square 2D array or Scipy sparse matrix
+        - check: Should the function check that `m` is symmetric? Default is False (the lower triangle is simply ignored)
+        '''
+        if m.shape[0] != m.shape[1]:
+            raise ValueError('A symmetric matrix must be square')
+        if check and (abs(csr_matrix(m) - csr_matrix(m).T) > 0).nnz > 0:
+            raise ValueError('The matrix is not symmetric')
+
+        return cls.from_upper(triu(m, format='csr'))
+
+    @classmethod
+    def from_upper(cls, u):
+        '''Build from a sparse matrix that holds the upper triangle (entries below the diagonal are not allowed)'''
+        u = csr_matrix(u)
+        u.sum_duplicates()
+
+        return cls(u.data, u.indices, u.indptr, u.shape)
+
+    @property
+    def nnz(self):
+        '''Number of stored values (upper triangle only)'''
+        return len(self.data)
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    def upper(self):
+        '''The upper triangle as a Scipy CSR matrix (shares the arrays, no copy)'''
+        return csr_matrix((self.data, self.indices, self.indptr), shape=self.shape, copy=False)
+
+    def diagonal(self):
+        return self.upper().diagonal()
+
+    def _column_index(self):
+        '''Column-major index of the triangle: `(col_indptr, col_pos)` where `col_pos` points into `data` (in the dtype of `indices`)
+
+        Only the positions are stored (the row of a position is found with a binary search in `indptr`), so the index costs one `indices`-sized array
+        '''
+        if self._columns is None:
+            n = self.shape[0]
+            col_pos = argsort(self.indices, kind='stable').astype(self.indices.dtype)
+            col_indptr = concatenate([[0], cumsum(bincount(self.indices, minlength=n))])
+            self._columns = (col_indptr, col_pos)
+
+        return self._columns
+
+    def neighbours(self, i):
+        '''Non-zero entries of row `i`
+
+        Returns a tuple `(indices, values)` of 1D arrays, sorted by index
+        '''
+        col_indptr, col_pos = self._column_index()
+        below = slice(col_indptr[i], col_indptr[i + 1])
+        above = slice(self.indptr[i], self.indptr[i + 1])
+        # Column `i` holds the rows j <= i, row `i` the columns j >= i. The diagonal appears in both, keep it once
+        lower_pos = col_pos[below]
+        lower_rows = searchsorted(self.indptr, lower_pos, side='right') - 1
+        keep = lower_rows != i
+        indices = concatenate([lower_rows[keep], self.indices[above]])
+        values = concatenate([self.data[lower_pos[keep]], self.data[above]])
+        order = argsort(indices, kind='stable')
+
+        return indices[order], values[order]
+
+    def dot(self, x):
+        '''Matrix-vector (or matrix-matrix) product with a dense `x`, computed as U x + U^T x - diag(U) x'''
+        u = self.upper()
+        x = asarray(x)
+        d = self.diagonal()
+        if x.ndim > 1:
+            d = d.reshape(-1, 1)
+
+        return u @ x + u.T @ x - d * x
+
+    def __matmul__(self, x):
+        return self.dot(x)
+
+    def tocsr(self):
+        '''The full symmetric matrix as a Scipy CSR matrix'''
+        u = self.upper()
+        # Adding the strict lower triangle (rather than subtracting the diagonal) keeps the dtype
+        return csr_matrix(u + triu(u, k=1).T)
+
+    def toarray(self):
+        return self.tocsr().toarray()
+
+    def todense(self):
+        return self.tocsr().todense()
+
+    def permute(self, order):
+        '''Re-order rows and columns, so that the new row `i` is the old row `order[i]`
+
+        Params:
+        - order: A list / 1D array of integers, which makes a permutation of the matrix rows (not checked, see `sim_matrix_shuffle`)
+
+        Returns a new `SymmetricSparse`
+        '''
+        inverse = empty_like(asarray(order))
+        inverse[asarray(order)] = arange(len(order))
+        u = coo_matrix(self.upper())
+        rows, cols = inverse[u.row], inverse[u.col]
+
+        return SymmetricSparse.from_upper(coo_matrix((u.data, (minimum(rows, cols), maximum(rows, cols))), shape=self.shape))
+
+    def __repr__(self):
+        return '<{}x{} SymmetricSparse matrix of type {} with {} stored elements (upper triangle)>'.format(self.shape[0], self.shape[1], self.dtype, self.nnz)
+
@@ -1,6 +1,5 @@
-from importlib.util import find_spec
-from numpy import stack, nan, unique, full
-from scipy.sparse import block_diag
+from os import PathLike
+from numpy import stack, nan, unique, full, load, array, argsort, split, cumsum
 
 def is_permutation(p):
     '''Check that the integer vector `p` is a permutation of {min(p) ... max(p)}'''
@@ -45,6 +44,22 @@ def sort_partition(p, by=min, reverse=False):
     return [y for x,y in sorted(zip(map(by, p), p), reverse=reverse)]
 
 
+def labels2partition(labels):
+    '''Convert a vector of labels (one per row) into a partition of the rows
+
+    Params:
+    - labels: A list / 1D Numpy array of labels. Rows with the same label end up in the same part
+
+    Returns a tuple `(partition, values)`: a list of lists partitioning the rows (see `quotient_similarity`), ordered by label, and the matching sorted unique labels
+    '''
+    labels = array(labels)
+    order = argsort(labels, kind='stable')
+    values, counts = unique(labels, return_counts=True)
+    partition = [p.tolist() for p in split(order, cumsum(counts)[:-1])]
+
+    return partition, values
+
+
 def series2array2D(s, none_treament='row', width=None, replicate=False):
     '''Convert a Pandas series containing arrays or list (and possibly rows with a single `None` value) into a "flat" 2D Numpy array
 
@@ -78,6 +93,21 @@ def series2array2D(s, none_treament='row', width=None, replicate=False):
     return stack(a)
 
 
+def load_features(a, mmap_mode='r'):
+    '''Open a feature array that may be stored on disk
+
+    Params:
+    - a: A Numpy array (returned as is) or a path to a `.npy` file
+    - mmap_mode: Passed to `numpy.load`. Default is `r` (read-only memory map), so several processes can share the same file without loading it
+
+    Returns a Numpy array or `np.memmap`
+    '''
+    if isinstance(a, (str, PathLike)):
+        return load(a, mmap_mode=mmap_mode)
+
+    return a
+
+
 def id_block_matrix(ids, value=1, diag_value=None):
     '''Generate a block matrix of 1's based on a sorted list of IDs
 
@@ -87,6 +117,8 @@ def id_block_matrix(ids, value=1, diag_value=None):
 
     Usage: Add information from a higher hierarcy to the similarity matrix.
     '''
+    from scipy.sparse import block_diag
+
     if ids != sorted(ids):
         raise ValueError('List must ne sorted to ensure additivity works')
 
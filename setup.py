@@ -23,7 +23,10 @@ setuptools.setup(
         'Topic :: Scientific/Engineering :: Image Processing',
         'Topic :: Scientific/Engineering :: Information Analysis'
     ],
-    python_requires='>=3.6',
+    entry_points={
+        'console_scripts': ['pysimscale=pysimscale.cli:main']
+    },
+    python_requires='>=3.7',
     install_requires=[
         'numpy',
         'scipy'
@@ -0,0 +1,86 @@
+import pytest
+from argparse import ArgumentTypeError
+from numpy import save, allclose, array
+from numpy.random import default_rng
+from scipy.sparse import load_npz, csr_matrix
+from pysimscale import truncated_sparse_similarity, quotient_similarity, labels2partition
+from pysimscale.cli import main, parse_memory, parse_top_k
+
+
+@pytest.fixture
+def features(tmp_path):
+    a = default_rng(0).normal(0, 1, (20, 5))
+    path = str(tmp_path / 'features.npy')
+    save(path, a)
+    return a, path
+
+labels = array(['b', 'a', 'c', 'a', 'b'] * 4)
+
+
+def test_parse_memory():
+    assert parse_memory('512') == 512
+    assert parse_memory('2k') == 2048
+    assert parse_memory('1.5GB') == 3 * 2 ** 29
+
+def test_parse_top_k():
+    assert parse_top_k('3') == 3
+    with pytest.raises(ArgumentTypeError):
+        parse_top_k('0')
+
+def test_cli_bad_top_k(features, tmp_path):
+    _, path = features
+    with pytest.raises(SystemExit):
+        main(['similarity', path, '-o', str(tmp_path / 'sim.npz'), '-k', '0', '-q'])
+
+def test_labels2partition():
+    partition, values = labels2partition(['b', 'a', 'b', 'c'])
+    assert partition == [[1], [0, 2], [3]]
+    assert values.tolist() == ['a', 'b', 'c']
+
+def test_cli_similarity(features, tmp_path):
+    a, path = features
+    out = str(tmp_path / 'sim.npz')
+    assert main(['similarity', path, '-o', out, '-t', '0.3', '-b', '3', '-j', '1', '-q']) == 0
+    expected = truncated_sparse_similarity(a, metric='cosine', thresh=0.3, n_jobs=1)
+    assert allclose(load_npz(out).todense(), expected.todense())
+
+def test_cli_top_k(features, tmp_path):
+    a, path = features
+    out = str(tmp_path / 'sim.npz')
+    assert main(['similarity', path, '-o', out, '-t', 'none', '-k', '3', '--memory', '1M', '-j', '1', '-q']) == 0
+    assert (load_npz(out).getnnz(axis=1) <= 3).all()
+
+def test_cli_shards_and_quotient(features, tmp_path):
+    a, path = features
+    labels_path = str(tmp_path / 'labels.txt')
+    with open(labels_path, 'w') as f:
+        f.write('\n'.join(labels))
+
+    shards = [str(tmp_path / 'sim_{}.npz'.format(i)) for i in range(3)]
+    for i, s in enumerate(shards):
+        assert main(['similarity', path, '-o', s, '-t', '0.3', '-b', '2', '--shard', str(i), '3', '-j', '1', '-q']) == 0
+
+    out = str(tmp_path / 'q.npz')
+    assert main(['merge'] + shards + ['-o', out, '--labels', labels_path, '--agg', 'max', '-j', '1', '-q']) == 0
+
+    sim = truncated_sparse_similarity(a, metric='cosine', thresh=0.3, n_jobs=1)
+    expected = quotient_similarity(csr_matrix(sim), labels2partition(labels)[0], agg='max', n_cpu=1)
+    assert allclose(load_npz(out).todense(), expected.todense())
+
+def test_cli_quotient(features, tmp_path):
+    a, path = features
+    sim_path, labels_path, out = [str(tmp_path / f) for f in ('sim.npz', 'labels.npy', 'q.npz')]
+    save(labels_path, labels)
+    assert main(['similarity', path, '-o', sim_path, '-t', '0.3', '-j', '1', '-q']) == 0
+    assert main(['quotient', sim_path, labels_path, '-o', out, '-j', '1']) == 0
+    assert load_npz(out).shape == (3, 3)
+
+def test_cli_wrong_labels(features, tmp_path):
+    a, path = features
+    labels_path = str(tmp_path / 'labels.npy')
+    save(labels_path, labels[:5])
+    assert main(['similarity', path, '-o', str(tmp_path / 'sim.npz'), '--labels', labels_path, '-j', '1', '-q']) == 1
+
+def test_cli_shard_with_labels(features, tmp_path):
+    a, path = features
+    assert main(['similarity', path, '-o', str(tmp_path / 'sim.npz'), '--shard', '0', '2', '--labels', 'x.npy', '-q']) == 1
@@ -0,0 +1,69 @@
+import pytest
+from numpy import array, arange, array_equal, save
+from numpy.random import default_rng
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+from pysimscale import truncated_sparse_similarity, truncated_connected_components, union_edges, find_roots, id_block_matrix
+
+
+a = array([
+    [1, 1, 1, 1],
+    [0, 1, 0, 2],
+    [2.2, 2, 2.2, 0.5],
+    [0, 1, 0, 2.1],
+    [-1, 0, 0, 0]
+])
+
+
+def same_partition(l1, l2):
+    '''Two label vectors describe the same partition if the label pairs map one-to-one'''
+    pairs = set(zip(l1.tolist(), l2.tolist()))
+    return len(pairs) == len(set(l1.tolist())) == len(set(l2.tolist()))
+
+
+def test_union_edges():
+    parent = union_edges(arange(6), array([5, 1, 3]), array([1, 0, 4]))
+    assert array_equal(find_roots(parent, arange(6)), array([0, 0, 2, 3, 3, 0]))
+
+def test_union_edges_race():
+    parent = union_edges(arange(4), array([3, 3, 3]), array([2, 1, 0]))
+    assert (find_roots(parent, arange(4)) == 0).all()
+
+def test_components_cosine():
+    n, labels = truncated_connected_components(a, metric='cosine', thresh=0.9, n_jobs=1)
+    assert n == 3
+    assert array_equal(labels, array([0, 1, 0, 1, 2]))
+
+def test_components_npy_path(tmp_path):
+    path = str(tmp_path / 'a.npy')
+    save(path, a)
+    n, labels = truncated_connected_components(path, metric='cosine', thresh=0.9, n_jobs=1)
+    assert n == 3
+    assert array_equal(labels, array([0, 1, 0, 1, 2]))
+
+def test_components_ids():
+    n, labels = truncated_connected_components(a, metric='cosine', thresh=0.9, ids=['x', 'y', 'z', 'w', 'x'], n_jobs=1)
+    assert n == 2
+    assert array_equal(labels, array([0, 1, 0, 1, 0]))
+
+def test_components_wrong_ids():
+    with pytest.raises(ValueError):
+        truncated_connected_components(a, metric='cosine', ids=[1, 2], n_jobs=1)
+
+@pytest.mark.parametrize('block_size,n_jobs', [(1, 1), (7, 1), (7, 2)])
+def test_components_match_scipy(block_size, n_jobs):
+    b = default_rng(0).integers(0, 2, (60, 12))
+    sim = truncated_sparse_similarity(b, metric='hamming', thresh=0.8, n_jobs=1)
+    n_expected, expected = connected_components(sim, directed=False)
+    n, labels = truncated_connected_components(b, metric='hamming', thresh=0.8, block_size=block_size, n_jobs=n_jobs)
+    assert n == n_expected
+    assert same_partition(labels, expected)
+
+def test_components_match_id_block_matrix():
+    b = default_rng(1).integers(0, 2, (40, 10))
+    ids = sorted(default_rng(2).integers(0, 15, 40).tolist())
+    sim = truncated_sparse_similarity(b, metric='hamming', thresh=0.8, n_jobs=1) + id_block_matrix(ids)
+    n_expected, expected = connected_components(csr_matrix(sim), directed=False)
+    n, labels = truncated_connected_components(b, metric='hamming', thresh=0.8, block_size=8, ids=ids, n_jobs=1)
+    assert n == n_expected
+    assert same_partition(labels, expected)
@@ -0,0 +1,51 @@
+import pytest
+import subprocess
+import sys
+from numpy import array, allclose
+from scipy.sparse import csr_matrix
+import pysimscale
+import pysimscale.parallel
+from pysimscale import truncated_sparse_similarity, quotient_similarity
+
+
+def run_python(code):
+    return subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+
+
+def test_import_is_lazy():
+    r = run_python(
+        'import sys, pysimscale\n'
+        'print(sorted(m for m in ("numpy", "scipy", "joblib", "pysimscale.similarity", "pysimscale.quotient") if m in sys.modules))'
+    )
+    assert r.stdout.strip() == '[]'
+    assert r.stderr == ''
+
+def test_utils_does_not_load_scipy():
+    r = run_python('import sys\nfrom pysimscale import is_partition\nprint("scipy" in sys.modules)')
+    assert r.stdout.strip() == 'False'
+
+def test_star_import():
+    r = run_python('from pysimscale import *\nprint(truncated_sparse_similarity.__module__, RunStats.__module__)')
+    assert r.stdout.split() == ['pysimscale.similarity', 'pysimscale.stats']
+
+def test_unknown_name():
+    with pytest.raises(AttributeError):
+        pysimscale.not_a_function
+
+def test_dir():
+    assert set(pysimscale.__all__) <= set(dir(pysimscale))
+
+
+def test_no_joblib_fallback(monkeypatch):
+    monkeypatch.setattr(pysimscale.parallel, 'HAS_JOBLIB', False)
+    a = array([[1, 1, 1, 1], [0, 1, 0, 2], [2.2, 2, 2.2, 0.5]])
+    with pytest.warns(RuntimeWarning):
+        sim = truncated_sparse_similarity(a, metric='cosine', thresh=0, diag_value=None, n_jobs=-1)
+    assert allclose(sim.todense(), truncated_sparse_similarity(a, metric='cosine', thresh=0, diag_value=None, n_jobs=1).todense())
+
+def test_no_joblib_fallback_quotient(monkeypatch):
+    monkeypatch.setattr(pysimscale.parallel, 'HAS_JOBLIB', False)
+    m = csr_matrix(array([[1.0, 0.5, 0.0], [0.5, 1.0, 0.2], [0.0, 0.2, 1.0]]))
+    with pytest.warns(RuntimeWarning):
+        q = quotient_similarity(m, [[0, 1], [2]], n_cpu=-1)
+    assert allclose(q.todense(), array([[3.0, 0.2], [0.2, 1.0]]))
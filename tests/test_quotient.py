@@ -4,11 +4,12 @@ from numpy import allclose, array
 from scipy.sparse import csr_matrix, issparse
 from pysimscale import merge_row_partition, quotient_similarity
 
+HAS_NX = False
 if find_spec('networkx') is not None:
     HAS_NX = True
 
 if HAS_NX:
-    from networkx import from_scipy_sparse_matrix, quotient_graph, to_numpy_array, Graph
+    from networkx import from_scipy_sparse_array, quotient_graph, to_numpy_array, Graph
 
 m = csr_matrix(array([
     [1.0, 0.9, 0.0, 0.2, 0.0, 0.1],
@@ -70,7 +71,7 @@ def test_quotient_bad_partition():
 
 
 if HAS_NX:
-    G = from_scipy_sparse_matrix(m)
+    G = from_scipy_sparse_array(m)
 
     def edge_sum(u, v):
         Guv = Graph(G.subgraph(list(u) + list(v)))
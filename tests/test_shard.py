@@ -0,0 +1,80 @@
+import pytest
+from multiprocessing import get_context
+from numpy import save, load, allclose
+from numpy.random import default_rng
+from pysimscale import truncated_sparse_similarity, shard_range, similarity_shard, merge_shards
+
+
+def run_shard(args):
+    '''Stand-in for a single node: compute one shard straight from the shared file'''
+    path, out, shard, n_shards = args
+    return similarity_shard(path, out, shard, n_shards, block_size=4, metric='cosine', thresh=0.2, n_jobs=1)
+
+
+@pytest.fixture
+def features(tmp_path):
+    a = default_rng(0).normal(0, 1, (30, 6))
+    path = str(tmp_path / 'features.npy')
+    save(path, a)
+    return a, path
+
+
+def test_shard_range_covers_rows():
+    ranges = [shard_range(30, i, 4, block_size=4) for i in range(4)]
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == 30
+    assert all(r1[1] == r2[0] for r1, r2 in zip(ranges[:-1], ranges[1:]))
+    assert all(r[0] % 4 == 0 for r in ranges)
+
+def test_shard_range_wrong_shard():
+    with pytest.raises(ValueError):
+        shard_range(30, 4, 4)
+
+def test_similarity_from_path(features):
+    a, path = features
+    assert allclose(
+        truncated_sparse_similarity(path, metric='cosine', thresh=0.2, n_jobs=1).todense(),
+        truncated_sparse_similarity(a, metric='cosine', thresh=0.2, n_jobs=1).todense()
+    )
+
+def test_similarity_memmap(features):
+    a, path = features
+    assert allclose(
+        truncated_sparse_similarity(load(path, mmap_mode='r'), metric='cosine', thresh=0.2, n_jobs=1).todense(),
+        truncated_sparse_similarity(a, metric='cosine', thresh=0.2, n_jobs=1).todense()
+    )
+
+def test_row_range(features):
+    a, path = features
+    full = truncated_sparse_similarity(a, metric='cosine', thresh=0.2, diag_value=0, n_jobs=1).todense()
+    part = truncated_sparse_similarity(path, metric='cosine', thresh=0.2, diag_value=0, n_jobs=1, row_range=(10, 20))
+    assert part.shape == (10, 30)
+    assert allclose(part.todense(), full[10:20])
+
+def test_merge_shards_processes(features, tmp_path):
+    a, path = features
+    n_shards = 3
+    jobs = [(path, str(tmp_path / 'shard_{}.npz'.format(i)), i, n_shards) for i in range(n_shards)]
+
+    with get_context('spawn').Pool(n_shards) as pool:
+        pool.map(run_shard, jobs)
+
+    merged = merge_shards([j[1] for j in jobs])
+    expected = truncated_sparse_similarity(a, block_size=4, metric='cosine', thresh=0.2, n_jobs=1)
+    assert allclose(merged.todense(), expected.todense())
+
+def test_merge_shards_empty_shard(features, tmp_path):
+    a, path = features
+    paths = [str(tmp_path / 'shard_{}.npz'.format(i)) for i in range(10)]
+    for i, p in enumerate(paths):
+        similarity_shard(path, p, i, 10, block_size=4, metric='cosine', thresh=0.2, n_jobs=1)
+
+    expected = truncated_sparse_similarity(a, metric='cosine', thresh=0.2, n_jobs=1)
+    assert allclose(merge_shards(paths).todense(), expected.todense())
+
+def test_merge_shards_missing(features, tmp_path):
+    a, path = features
+    p = str(tmp_path / 'shard_0.npz')
+    similarity_shard(path, p, 0, 2, metric='cosine', n_jobs=1)
+    with pytest.raises(ValueError):
+        merge_shards([p])
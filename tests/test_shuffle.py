@@ -76,3 +76,21 @@ def test_sim_matrix_shuffle():
     m_shuffled = sim_matrix_shuffle(m, row_order=[0, 5, 2, 3, 4, 1])
 
     assert allclose(m_shuffled.todense(), expected)
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+def test_sim_matrix_shuffle_not_involution(sparse):
+    m = array([
+        [1.0, 0.9, 0.0, 0.2, 0.0, 0.1],
+        [0.9, 1.0, 0.6, 0.0, 0.0, 0.0],
+        [0.0, 0.6, 1.0, 0.0, 0.5, 0.0],
+        [0.2, 0.0, 0.0, 1.0, 0.0, 0.0],
+        [0.0, 0.0, 0.5, 0.0, 1.0, 0.8],
+        [0.1, 0.0, 0.0, 0.0, 0.8, 1.0]
+    ])
+    # Applying this order twice does not give back the identity, so it tells apart P M P^T from P^T M P
+    order = [3, 0, 5, 1, 4, 2]
+
+    m_shuffled = sim_matrix_shuffle(csr_matrix(m) if sparse else m, row_order=order)
+
+    assert allclose(m_shuffled.todense() if sparse else m_shuffled, m[order][:, order])
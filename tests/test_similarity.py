@@ -1,10 +1,11 @@
 import pytest
 from importlib.util import find_spec
 
-from numpy import array, allclose, matmul
+from numpy import array, allclose, matmul, exp
 from numpy.linalg import norm
-from scipy.sparse import coo_matrix, issparse
-from pysimscale import truncated_sparse_similarity, similarity_sparse_block
+from numpy.random import default_rng
+from scipy.sparse import coo_matrix, csr_matrix, issparse
+from pysimscale import truncated_sparse_similarity, similarity_sparse_block, metric_preprocess
 
 HAS_JOBLIB = False
 if find_spec('joblib') is not None:
@@ -63,6 +64,20 @@ def test_sim_wrong_metric():
     with pytest.raises(ValueError):
          truncated_sparse_similarity(a1, metric=None, n_jobs=1)
 
+@pytest.mark.parametrize('top_k', [0, -1])
+def test_sim_bad_top_k(top_k):
+    with pytest.raises(ValueError):
+        truncated_sparse_similarity(a1, metric='cosine', top_k=top_k, n_jobs=1)
+    with pytest.raises(ValueError):
+        similarity_sparse_block(a1, [0], thresh=None, metric='cosine', top_k=top_k)
+
+@pytest.mark.parametrize('metric,thresh', [('hamming', 0), ('cosine', -1)])
+def test_top_k_binary_low_thresh(metric, thresh):
+    b = default_rng(0).integers(0, 2, (10, 8))
+    m = truncated_sparse_similarity(b, metric=metric, thresh=thresh, top_k=3, binary=True, diag_value=None, n_jobs=1)
+    assert (m.getnnz(axis=1) == 3).all()
+    assert set(m.data) == {1}
+
 def test_cosine_no_thresh():
     assert allclose(
         truncated_sparse_similarity(a1, metric='cosine', thresh=0, diag_value=None, n_jobs=1).todense(),
@@ -127,3 +142,94 @@ def test_hamming_thresh_dense():
         truncated_sparse_similarity(a2, metric='hamming', thresh=sim_thresh, diag_value=0, n_jobs=n_cpu).todense(),
         expected
     )
+
+
+a3 = array([
+    [1, 1, 0, 0, 1],
+    [0, 1, 0, 0, 1],
+    [1, 0, 1, 1, 0],
+    [0, 0, 0, 0, 0]
+])
+expected_jaccard_sim = array([
+    [1.0, 2 / 3, 1 / 5, 0.0],
+    [2 / 3, 1.0, 0.0, 0.0],
+    [1 / 5, 0.0, 1.0, 0.0],
+    [0.0, 0.0, 0.0, 0.0]
+])
+
+def brute_force(a, f):
+    return array([[f(x, y) for y in a] for x in a])
+
+
+def test_hamming_bool():
+    assert allclose(
+        truncated_sparse_similarity(a2.astype(bool), metric='hamming', thresh=0, diag_value=0, n_jobs=1).todense(),
+        expected_hamming_sim
+    )
+
+def test_jaccard_binary():
+    assert allclose(
+        truncated_sparse_similarity(a3, metric='jaccard', thresh=0, diag_value=None, n_jobs=1).todense(),
+        expected_jaccard_sim
+    )
+
+def test_jaccard_sparse_input():
+    assert allclose(
+        truncated_sparse_similarity(csr_matrix(a3.astype(bool)), metric='jaccard', thresh=0, diag_value=None, block_size=3, n_jobs=1).todense(),
+        expected_jaccard_sim
+    )
+
+def test_tanimoto_real():
+    expected = brute_force(a1, lambda x, y: x.dot(y) / (x.dot(x) + y.dot(y) - x.dot(y)))
+    assert allclose(
+        truncated_sparse_similarity(a1, metric='tanimoto', thresh=0, diag_value=None, block_size=2, n_jobs=1).todense(),
+        expected
+    )
+
+def test_dot():
+    assert allclose(
+        truncated_sparse_similarity(a1, metric='dot', thresh=None, diag_value=None, n_jobs=1).todense(),
+        matmul(a1, a1.T)
+    )
+
+def test_euclidean():
+    expected = brute_force(a1, lambda x, y: 1 / (1 + norm(x - y)))
+    assert allclose(
+        truncated_sparse_similarity(a1, metric='euclidean', thresh=0, diag_value=None, n_jobs=1).todense(),
+        expected
+    )
+
+def test_rbf():
+    expected = brute_force(a1, lambda x, y: exp(-0.5 * norm(x - y) ** 2))
+    assert allclose(
+        truncated_sparse_similarity(a1, metric='rbf', gamma=0.5, thresh=0, diag_value=None, n_jobs=1).todense(),
+        expected
+    )
+
+def test_rbf_default_gamma():
+    expected = brute_force(a1, lambda x, y: exp(-norm(x - y) ** 2 / a1.shape[1]))
+    assert allclose(similarity_sparse_block(a1, [0, 1], thresh=0, metric='rbf').todense(), expected[[0, 1], :])
+
+def test_sparse_matches_dense():
+    for metric in ('cosine', 'dot', 'euclidean', 'hamming'):
+        assert allclose(
+            truncated_sparse_similarity(csr_matrix(a1), metric=metric, thresh=0.2, n_jobs=1).todense(),
+            truncated_sparse_similarity(a1, metric=metric, thresh=0.2, n_jobs=1).todense()
+        )
+
+def test_precomputed_shared():
+    precomputed = metric_preprocess(a1, 'tanimoto')
+    assert allclose(
+        similarity_sparse_block(a1, [1, 2], thresh=0, metric='tanimoto', precomputed=precomputed).todense(),
+        similarity_sparse_block(a1, [1, 2], thresh=0, metric='tanimoto').todense()
+    )
+
+def test_new_metrics_parallel():
+    if HAS_JOBLIB:
+        for metric in ('jaccard', 'euclidean', 'rbf'):
+            assert allclose(
+                truncated_sparse_similarity(a3, metric=metric, thresh=0.3, block_size=2, n_jobs=2).todense(),
+                truncated_sparse_similarity(a3, metric=metric, thresh=0.3, block_size=2, n_jobs=1).todense()
+            )
+    else:
+        print('Could not find a Joblib instalation, skipping test')
@@ -0,0 +1,54 @@
+import pytest
+from numpy.random import default_rng
+from numpy import allclose
+from scipy.sparse import csr_matrix
+from pysimscale import RunStats, truncated_sparse_similarity, truncated_connected_components, quotient_similarity, labels2partition
+
+a = default_rng(0).normal(0, 1, (25, 4))
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_similarity_stats(n_jobs):
+    stats = RunStats()
+    sim = truncated_sparse_similarity(a, metric='cosine', thresh=0.5, block_size=4, diag_value=0, n_jobs=n_jobs, stats=stats)
+    assert stats.blocks_done == stats.n_blocks == 7
+    assert sum(stats.nnz_per_block) >= sim.nnz
+    assert {'matmul', 'threshold', 'coo', 'vstack', 'setdiag', 'eliminate_zeros'} <= set(stats.phases)
+    assert stats.peak_memory is None or stats.peak_memory > 0
+
+def test_similarity_stats_same_result():
+    expected = truncated_sparse_similarity(a, metric='cosine', thresh=0.5, block_size=4, n_jobs=1)
+    sim = truncated_sparse_similarity(a, metric='cosine', thresh=0.5, block_size=4, n_jobs=1, stats=RunStats())
+    assert allclose(sim.todense(), expected.todense())
+
+def test_callback():
+    progress = []
+    stats = RunStats(callback=lambda s: progress.append((s.blocks_done, s.n_blocks)))
+    truncated_sparse_similarity(a, metric='cosine', thresh=0.5, block_size=10, n_jobs=1, stats=stats)
+    assert progress == [(1, 3), (2, 3), (3, 3)]
+
+def test_components_stats():
+    stats = RunStats()
+    truncated_connected_components(a, metric='cosine', thresh=0.5, block_size=5, n_jobs=1, stats=stats)
+    assert stats.blocks_done == 5
+    assert 'union_find' in stats.phases
+
+@pytest.mark.parametrize('n_cpu', [1, 2])
+def test_quotient_stats(n_cpu):
+    sim = csr_matrix(truncated_sparse_similarity(a, metric='cosine', thresh=0.5, n_jobs=1))
+    partition, _ = labels2partition(default_rng(1).integers(0, 6, 25))
+    stats = RunStats()
+    q = quotient_similarity(sim, partition, diag_value=0, n_cpu=n_cpu, stats=stats)
+    assert allclose(q.todense(), quotient_similarity(sim, partition, diag_value=0, n_cpu=1).todense())
+    assert stats.blocks_done == stats.n_blocks == 2 * len(partition)
+    assert {'aggregate', 'vstack', 'setdiag', 'eliminate_zeros'} <= set(stats.phases)
+
+def test_as_dict():
+    stats = RunStats()
+    with stats.phase('custom'):
+        pass
+    stats.block_done(nnz=3, timings={'matmul': 0.5, 'peak_memory': None})
+    d = stats.as_dict()
+    assert d['nnz'] == 3
+    assert d['phases']['matmul'] == 0.5
+    assert 'custom' in d['phases']
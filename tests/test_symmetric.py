@@ -0,0 +1,116 @@
+import pytest
+from numpy import array, allclose, array_equal, arange
+from numpy.random import default_rng
+from scipy.sparse import csr_matrix
+from pysimscale import RunStats, SymmetricSparse, truncated_sparse_similarity, quotient_similarity, sim_matrix_shuffle
+
+m = array([
+    [1.0, 0.9, 0.0, 0.2, 0.0, 0.1],
+    [0.9, 1.0, 0.6, 0.0, 0.0, 0.0],
+    [0.0, 0.6, 1.0, 0.0, 0.5, 0.0],
+    [0.2, 0.0, 0.0, 1.0, 0.0, 0.0],
+    [0.0, 0.0, 0.5, 0.0, 1.0, 0.8],
+    [0.1, 0.0, 0.0, 0.0, 0.8, 1.0]
+])
+s = SymmetricSparse.from_matrix(csr_matrix(m))
+
+partition = [[2], [1, 0, 3], [4, 5]]
+
+
+def test_stores_one_triangle():
+    assert s.nnz == (csr_matrix(m).nnz + 6) // 2
+    assert s.shape == (6, 6)
+
+def test_roundtrip():
+    assert allclose(s.toarray(), m)
+    assert allclose(SymmetricSparse.from_matrix(m).todense(), m)
+
+def test_not_symmetric():
+    with pytest.raises(ValueError):
+        SymmetricSparse.from_matrix(array([[1, 2], [3, 4]]), check=True)
+
+def test_not_square():
+    with pytest.raises(ValueError):
+        SymmetricSparse.from_matrix(array([[1, 2, 3], [3, 4, 5]]))
+
+def test_neighbours():
+    for i in range(6):
+        indices, values = s.neighbours(i)
+        assert array_equal(indices, m[i].nonzero()[0])
+        assert allclose(values, m[i, indices])
+
+def test_neighbours_index_size():
+    t = SymmetricSparse.from_matrix(csr_matrix(m))
+    t.neighbours(0)
+    assert sum(x.nbytes for x in t._columns) <= t.indices.nbytes + t.indptr.nbytes * 2
+
+def test_dot():
+    x = arange(6.0)
+    assert allclose(s.dot(x), m @ x)
+    assert allclose(s @ x.reshape(6, 1), m @ x.reshape(6, 1))
+    X = default_rng(0).normal(0, 1, (6, 3))
+    assert allclose(s @ X, m @ X)
+
+def test_permute():
+    order = [3, 0, 5, 1, 4, 2]
+    assert allclose(s.permute(order).toarray(), m[order][:, order])
+
+def test_shuffle():
+    order = [3, 0, 5, 1, 4, 2]
+    shuffled = sim_matrix_shuffle(s, order)
+    assert isinstance(shuffled, SymmetricSparse)
+    assert allclose(shuffled.toarray(), sim_matrix_shuffle(csr_matrix(m), order).toarray())
+
+def test_shuffle_check():
+    with pytest.raises(ValueError):
+        sim_matrix_shuffle(s, [0, 1, 2])
+
+@pytest.mark.parametrize('agg', ['sum', 'max', 'mean'])
+def test_quotient(agg):
+    assert allclose(
+        quotient_similarity(s, partition, agg=agg, n_cpu=1).todense(),
+        quotient_similarity(csr_matrix(m), partition, agg=agg, n_cpu=1).todense()
+    )
+
+def test_quotient_diag():
+    assert allclose(
+        quotient_similarity(s, partition, diag_value=0, n_cpu=1).todense(),
+        quotient_similarity(csr_matrix(m), partition, diag_value=0, n_cpu=1).todense()
+    )
+
+@pytest.mark.parametrize('part', [[[0, 1]], [[2], [5, 4]]])
+def test_quotient_partial_partition(part):
+    q = quotient_similarity(s, part, n_cpu=1).todense()
+    assert allclose(q, quotient_similarity(csr_matrix(m), part, n_cpu=1).todense())
+    assert q.shape == (len(part), len(part))
+
+@pytest.mark.filterwarnings('error')
+def test_integer_dtype():
+    b = default_rng(0).integers(0, 2, (20, 6))
+    full = truncated_sparse_similarity(b, metric='hamming', thresh=0.5, binary=True, n_jobs=1)
+    sym = truncated_sparse_similarity(b, metric='hamming', thresh=0.5, binary=True, n_jobs=1, symmetric=True)
+    assert sym.toarray().dtype == full.dtype
+    assert array_equal(sym.toarray(), full.toarray())
+    part = [list(range(0, 20, 2)), list(range(1, 20, 2))]
+    q = quotient_similarity(sym, part, n_cpu=1)
+    assert q.dtype == quotient_similarity(csr_matrix(full), part, n_cpu=1).dtype
+    assert array_equal(q.toarray(), quotient_similarity(csr_matrix(full), part, n_cpu=1).toarray())
+
+def test_truncated_symmetric_stats():
+    stats = RunStats()
+    a = default_rng(0).normal(0, 1, (30, 5))
+    sym = truncated_sparse_similarity(a, metric='cosine', thresh=0.3, diag_value=None, block_size=4, n_jobs=1, symmetric=True, stats=stats)
+    assert sum(stats.nnz_per_block) == sym.nnz
+
+@pytest.mark.parametrize('block_size,n_jobs', [(1, 1), (4, 1), (4, 2)])
+def test_truncated_symmetric(block_size, n_jobs):
+    a = default_rng(0).normal(0, 1, (30, 5))
+    full = truncated_sparse_similarity(a, metric='cosine', thresh=0.3, block_size=block_size, n_jobs=1)
+    sym = truncated_sparse_similarity(a, metric='cosine', thresh=0.3, block_size=block_size, n_jobs=n_jobs, symmetric=True)
+    assert isinstance(sym, SymmetricSparse)
+    assert sym.nnz == full.nnz // 2
+    assert allclose(sym.toarray(), full.toarray())
+
+def test_truncated_symmetric_wrong_options():
+    with pytest.raises(ValueError):
+        truncated_sparse_similarity(m, metric='cosine', symmetric=True, top_k=2)